@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+
+"""
+Times every makimono stage on synthetic inputs of growing size.
+
+    python benchmarks/bench.py [-s 2000 10000 50000] [-o results.json] [-b baseline.json]
+
+Results (best and median wall time of each stage at each size, and the fitted
+scaling exponent of each stage) are printed and can be saved as JSON; a saved
+file can later be passed as a baseline, in which case stages that got slower
+than the tolerance allows are reported and the exit status is 1.
+"""
+
+import argparse, os, sys, json, time, shutil, tempfile, platform, subprocess
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synthetic
+from makimono import toolbox, plotter
+
+# ========================================================================================
+
+TIMEPOINTS = ["0", "1", "2", "4", "8", "12", "24", "48"]
+REPLICATES = 2
+SETS = 8
+ALPHA = 0.05
+
+
+def workload_sizes(scale):
+
+    """
+    Input sizes derived from a scale (the number of genes in the expression file).
+    """
+
+    return {"genes": scale, "sets": SETS, "setsize": max(50, scale // 20),
+            "terms": max(10, scale // 1000)}
+
+# ----------------------------------------------------------------------------------------
+# stages: each takes the workload context and runs the stage once
+
+def stage_expression(ctx):
+    toolbox.process_expression_values(open(ctx["expression"]), REPLICATES)
+
+
+def stage_annotations(ctx):
+    for name in ctx["names"]:
+        toolbox.read_annotation_file(ctx["sets"], name + ".txt")
+
+
+def stage_enrichment(ctx):
+    index = toolbox.EnrichmentIndex(ctx["sets"])
+    for name in ctx["names"]:
+        plus = toolbox.process_enrichment_values(ctx["sets"], name, ALPHA, index=index)
+        for key in ["bp", "mf", "cc", "kegg"]:
+            plus[key]
+
+
+def stage_mpl(ctx):
+    plotter.Mlplot(TIMEPOINTS, TIMEPOINTS).plot_mpl_figure(ctx["subset"], ctx["names"][0],
+                                                           savelocation=ctx["output"])
+
+
+def stage_bokeh(ctx):
+    plotter.Blur(TIMEPOINTS, TIMEPOINTS).generate_interactive_bokeh_plot(
+        ctx["subset"].apply(np.log), ctx["names"][0], ctx["output"], annots=ctx["annots"],
+        plus=ctx["plus"])
+
+
+def stage_makisu(ctx):
+    env = dict(os.environ, PYTHONPATH=ROOT, MPLBACKEND="Agg")
+    with open(os.devnull, "w") as devnull:
+        subprocess.check_call([sys.executable, os.path.join(ROOT, "bin", "makisu"), "-p", "bokehplus",
+                               "-e", ctx["expression"], "-r", str(REPLICATES), "-t"] + TIMEPOINTS +
+                              ["-i", ctx["sets"], "-o", ctx["output"], "--nocache"],
+                              env=env, stdout=devnull)
+
+
+STAGES = [("process_expression_values", stage_expression),
+          ("read_annotation_file", stage_annotations),
+          ("process_enrichment_values", stage_enrichment),
+          ("plot_mpl_figure", stage_mpl),
+          ("generate_interactive_bokeh_plot", stage_bokeh),
+          ("makisu_bulk", stage_makisu)]
+
+# ========================================================================================
+
+def prepare(workdir, scale):
+
+    """
+    Writes the synthetic inputs of a scale and loads what the plotting stages need.
+    """
+
+    sizes = workload_sizes(scale)
+    expression, sets, names = synthetic.write_workload(workdir, sizes["genes"], len(TIMEPOINTS),
+                                                       REPLICATES, sizes["sets"], sizes["setsize"],
+                                                       sizes["terms"])
+    output = os.path.join(workdir, "output")
+    os.makedirs(output)
+
+    annots = toolbox.read_annotation_file(sets, names[0] + ".txt")
+    data = toolbox.process_expression_values(open(expression), REPLICATES)
+
+    return {"expression": expression, "sets": sets, "names": names, "output": output,
+            "annots": annots, "subset": data.subset(annots.keys()),
+            "plus": toolbox.process_enrichment_values(sets, names[0], ALPHA), "sizes": sizes}
+
+
+
+def measure(func, ctx, repeat):
+
+    runs = []
+    for i in range(repeat):
+        start = time.time()
+        func(ctx)
+        runs.append(time.time() - start)
+
+    return runs
+
+
+
+def scaling_exponents(results):
+
+    """
+    Fits seconds ~ scale^k for every stage measured at more than one scale.
+    """
+
+    exponents = {}
+    for stage, func in STAGES:
+        points = [(r["scale"], r["best"]) for r in results if r["stage"] == stage and r["best"] > 0]
+        if len(points) > 1:
+            x, y = np.log([p[0] for p in points]), np.log([p[1] for p in points])
+            exponents[stage] = round(float(np.polyfit(x, y, 1)[0]), 3)
+
+    return exponents
+
+
+
+def compare(results, baseline, tolerance):
+
+    """
+    Prints the ratio to the baseline of every stage/scale found in both, and
+    returns the ones slower than (1 + tolerance) times the baseline.
+    """
+
+    previous = dict(((r["stage"], r["scale"]), r) for r in baseline["results"])
+    regressions = []
+
+    print "\n%-34s %8s %10s %10s %7s" % ("stage", "scale", "baseline", "now", "ratio")
+    for r in results:
+        old = previous.get((r["stage"], r["scale"]))
+        if old is None or old["best"] <= 0:
+            continue
+
+        ratio = r["best"] / old["best"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions.append(r)
+            flag = "  SLOWER"
+
+        print "%-34s %8d %9.3fs %9.3fs %6.2fx%s" % (r["stage"], r["scale"], old["best"], r["best"],
+                                                   ratio, flag)
+
+    return regressions
+
+# ========================================================================================
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="makimono benchmarks")
+
+    parser.add_argument('-s', '--scales', nargs='+', type=int, default=[2000, 10000, 50000],
+                        help='Numbers of genes of the synthetic expression files')
+    parser.add_argument('-n', '--repeat', type=int, default=3, help='Runs per stage and scale')
+    parser.add_argument('-t', '--stages', nargs='+', choices=[s for s, f in STAGES],
+                        help='Stages to run [defaults to all]')
+    parser.add_argument('-o', '--output', help='JSON file to save the results into')
+    parser.add_argument('-b', '--baseline', help='JSON results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed slowdown over the baseline [defaults to 0.25, i.e. 25%%]')
+    parser.add_argument('-k', '--keep', help='Keep the synthetic inputs in this folder')
+
+    args = parser.parse_args()
+
+    stages = [(s, f) for s, f in STAGES if args.stages is None or s in args.stages]
+    results = []
+
+    print "%-34s %8s %10s %10s" % ("stage", "scale", "best", "median")
+
+    for scale in args.scales:
+        if args.keep:
+            workdir = os.path.join(args.keep, str(scale))
+            if os.path.isdir(workdir):
+                shutil.rmtree(workdir)
+            os.makedirs(workdir)
+        else:
+            workdir = tempfile.mkdtemp(prefix="makimono-bench-")
+
+        try:
+            ctx = prepare(workdir, scale)
+
+            for stage, func in stages:
+                runs = measure(func, ctx, args.repeat)
+                results.append({"stage": stage, "scale": scale, "sizes": ctx["sizes"],
+                                "best": min(runs), "median": float(np.median(runs)), "runs": runs})
+                print "%-34s %8d %9.3fs %9.3fs" % (stage, scale, min(runs), np.median(runs))
+        finally:
+            if not args.keep:
+                shutil.rmtree(workdir)
+
+    report = {"python": platform.python_version(), "platform": platform.platform(),
+              "date": time.strftime("%Y-%m-%dT%H:%M:%S"), "repeat": args.repeat,
+              "results": results, "scaling": scaling_exponents(results)}
+
+    if report["scaling"]:
+        print "\nscaling exponents (seconds ~ scale^k):"
+        for stage, k in sorted(report["scaling"].items()):
+            print "    %-34s %.2f" % (stage, k)
+
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=1, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            regressions = compare(results, json.load(fh), args.tolerance)
+
+        if regressions:
+            print "\n%d stage(s) slower than the baseline allows." % len(regressions)
+            sys.exit(1)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+"""
+Import-time regression check: times a cold `makisu --help` and makes sure it
+does not load any of the heavy optional dependencies.
+
+    python benchmarks/importtime.py [-n 5] [--target 0.3]
+
+The best of the runs (each one a fresh interpreter) must stay under the target
+(seconds), and none of the HEAVY packages may be imported just to print the
+usage; otherwise the exit status is 1.
+"""
+
+import argparse, os, sys, time, subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAKISU = os.path.join(ROOT, "bin", "makisu")
+
+# packages only some output modes need (see bin/makisu)
+HEAVY = ["matplotlib", "bokeh", "pandas", "jinja2", "scipy", "rpy2"]
+
+# runs makisu --help in this interpreter and prints the top-level packages it imported
+PROBE = """
+import sys, runpy
+sys.argv = ["makisu", "--help"]
+stdout, sys.stdout = sys.stdout, open("/dev/null", "w")
+try:
+    runpy.run_path(%r, run_name="__main__")
+except SystemExit:
+    pass
+sys.stdout = stdout
+print " ".join(sorted(set(m.split(".")[0] for m, mod in sys.modules.items() if mod is not None)))
+"""
+
+# ========================================================================================
+
+def best_time(command, repeat, env):
+
+    runs = []
+    with open(os.devnull, "w") as devnull:
+        for i in range(repeat):
+            start = time.time()
+            subprocess.check_call(command, env=env, stdout=devnull)
+            runs.append(time.time() - start)
+
+    return min(runs)
+
+
+
+def loaded_packages(env):
+    return subprocess.check_output([sys.executable, "-c", PROBE % MAKISU], env=env).split()
+
+# ========================================================================================
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="makisu import-time check")
+
+    parser.add_argument('-n', '--repeat', type=int, default=5, help='Runs to take the best of')
+    parser.add_argument('--target', type=float, default=0.3,
+                        help='Maximum time of a cold makisu --help, in seconds [defaults to 0.3]')
+
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=ROOT)
+
+    interpreter = best_time([sys.executable, "-c", "pass"], args.repeat, env)
+    makisu = best_time([sys.executable, MAKISU, "--help"], args.repeat, env)
+    heavy = [p for p in loaded_packages(env) if p in HEAVY]
+
+    print "%-26s %7.3fs" % ("python -c pass", interpreter)
+    print "%-26s %7.3fs  (target %.3fs)" % ("makisu --help", makisu, args.target)
+    print "%-26s %s" % ("heavy packages loaded", " ".join(heavy) or "none")
+
+    if makisu > args.target or heavy:
+        print "\nmakisu --help is slower than the target or loads packages it does not need."
+        sys.exit(1)
@@ -0,0 +1,138 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os, random
+import numpy as np
+
+"""
+Synthetic makimono inputs for the benchmarks: expression counts, ClusterSeq-like
+set files (with annotations) and topGO/GOstats-like enrichment results.
+"""
+
+# ========================================================================================
+
+TERMS = ["ubiquitin ligase", "photosynthesis", "ribosome biogenesis", "flagellum assembly",
+         "lipid metabolic process", "DNA replication", "oxidation-reduction process",
+         "protein phosphorylation", "transmembrane transport", "cell cycle"]
+
+ANNOTATIONS = ["PDX2\tPyridoxal kinase\tPyridoxal kinase, involved in vitamin B6 biosynthesis.",
+               "RING/FYVE/PHD zinc finger superfamily protein", "Light-harvesting complex protein",
+               "Cyclin-dependent kinase", "Flagellar associated protein"]
+
+
+def gene_ids(genes):
+
+    return ["Syn%02d.g%06d.t1.1" % (i % 17, i) for i in range(genes)]
+
+
+
+def write_expression(path, genes, timepoints, replicates, seed=0):
+
+    """
+    Writes a tab-separated expression counts file: an identifier, then the
+    counts of every replicate of every time point. Profiles are smooth (log
+    normal around a per gene level, drifting over time) so the plots look like
+    real data. Returns the identifiers.
+    """
+
+    rs = np.random.RandomState(seed)
+    ids = gene_ids(genes)
+
+    level = rs.normal(4, 1.5, size=(genes, 1))
+    drift = np.cumsum(rs.normal(0, 0.4, size=(genes, timepoints)), axis=1)
+    means = np.exp(level + drift)
+    counts = rs.poisson(np.repeat(means, replicates, axis=1)).astype(np.int64)
+
+    with open(path, "w") as fh:
+        for start in range(0, genes, 4096):
+            block = counts[start:start + 4096]
+            fh.write("".join("%s\t%s\n" % (ids[start + i], "\t".join(map(str, row)))
+                             for i, row in enumerate(block.tolist())))
+
+    return ids
+
+
+
+def set_name(i):
+
+    # ClusterSeq-like cluster names
+    return "%03d_{0h}GT{2h}" % i
+
+
+
+def write_sets(directory, ids, sets, setsize, annotated=0.5, seed=0):
+
+    """
+    Writes 'sets' set files of 'setsize' identifiers drawn from 'ids'; about
+    the 'annotated' fraction of their lines carry (tab-separated) annotations,
+    the others only an empty annotation column. Returns the set names.
+    """
+
+    rnd = random.Random(seed)
+    names = []
+
+    for i in range(sets):
+        name = set_name(i)
+        with open(os.path.join(directory, name + ".txt"), "w") as fh:
+            for gene in rnd.sample(ids, min(setsize, len(ids))):
+                if rnd.random() < annotated:
+                    fh.write("%s\t%s\n" % (gene, rnd.choice(ANNOTATIONS)))
+                else:
+                    fh.write("%s\t\t\t\n" % gene)
+        names.append(name)
+
+    return names
+
+
+
+def write_enrichments(directory, names, terms, seed=0):
+
+    """
+    Writes topGO (goenrich/BP|MF|CC) and GOstats (keggenrich) result files with
+    'terms' rows for each set name, as enricher would.
+    """
+
+    rnd = random.Random(seed)
+
+    for folder in ["goenrich/BP", "goenrich/MF", "goenrich/CC", "keggenrich"]:
+        path = os.path.join(directory, folder)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        for name in names:
+            with open(os.path.join(path, name + "_enrichment.tsv"), "w") as fh:
+                if folder == "keggenrich":
+                    fh.write("KEGGID\tPvalue\tOddsRatio\tExpCount\tCount\tSize\tTerm\n")
+                    for t in range(terms):
+                        fh.write("%05d\t%.2g\t%.3f\t%.4f\t%d\t%d\t%s\n" % (
+                            rnd.randint(10, 9999), rnd.random() * 0.05, rnd.random() * 20,
+                            rnd.random(), rnd.randint(1, 10), rnd.randint(10, 200), rnd.choice(TERMS)))
+                else:
+                    fh.write("GO.ID\tTerm\tAnnotated\tSignificant\tExpected\tRank in classicFisher\t"
+                             "classicFisher\telimFisher\n")
+                    for t in range(terms):
+                        p = rnd.random() * 0.1
+                        fh.write("GO:%07d\t%s\t%d\t%d\t%.2f\t%d\t%.2g\t%.2g\n" % (
+                            rnd.randint(1, 2000000), rnd.choice(TERMS), rnd.randint(2, 500),
+                            rnd.randint(1, 20), rnd.random() * 5, t + 1, p, p))
+
+
+
+def write_workload(directory, genes, timepoints, replicates, sets, setsize, terms, seed=0):
+
+    """
+    Writes a complete makisu input tree into 'directory': expression.tsv and a
+    sets/ folder (set files plus enrichment results). Returns (expression file,
+    sets folder, set names).
+    """
+
+    setsdir = os.path.join(directory, "sets")
+    if not os.path.isdir(setsdir):
+        os.makedirs(setsdir)
+
+    expression = os.path.join(directory, "expression.tsv")
+    ids = write_expression(expression, genes, timepoints, replicates, seed)
+    names = write_sets(setsdir, ids, sets, setsize, seed=seed)
+    write_enrichments(setsdir, names, terms, seed)
+
+    return expression, setsdir, names
@@ -0,0 +1,143 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os, codecs
+import numpy as np
+
+import profiling
+
+"""
+Shared gene/transcript annotation index, built once from a master annotation
+file, so that set files only need to list their members.
+"""
+
+# ========================================================================================
+
+class AnnotationIndex(object):
+
+    """
+    Annotations of every gene/transcript in a master tsv file (same layout as
+    the set files: identifier, then tab-separated annotations; an identifier may
+    appear on several lines). Identifiers are interned and every distinct
+    annotation string is stored only once; each identifier points (through
+    compact integer arrays) to its list of annotation strings.
+    """
+
+    def __init__(self, annotationfile):
+
+        self.strings = []
+        self.index = {}
+
+        stringindex = {}
+        perid = {}
+
+        with profiling.stage("annotations"), codecs.open(annotationfile, encoding='latin-1') as fh:
+            for line in fh:
+                token = line.rstrip("\r\n").split("\t", 1)
+                if len(token) < 2 or token[0].strip() == "":
+                    continue
+
+                ident = intern(token[0].strip().encode('latin-1'))
+                annot = token[1]
+
+                if annot not in stringindex:
+                    stringindex[annot] = len(self.strings)
+                    self.strings.append(annot)
+
+                perid.setdefault(ident, []).append(stringindex[annot])
+
+        # CSR-like layout: refs[starts[i]:starts[i+1]] are the strings of id i
+        starts = [0]
+        refs = []
+        for i, ident in enumerate(perid):
+            self.index[ident] = i
+            refs.extend(perid[ident])
+            starts.append(len(refs))
+
+        self.starts = np.array(starts, dtype=np.int32)
+        self.refs = np.array(refs, dtype=np.int32)
+
+
+    def __contains__(self, ident):
+        return ident in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, ident):
+
+        i = self.index[ident]
+        return [self.strings[r] for r in self.refs[self.starts[i]:self.starts[i+1]]]
+
+
+    def view(self, members):
+
+        """
+        Returns the annotations of a set's members as an AnnotationView, a
+        drop-in replacement for the dictionary read_annotation_file returns.
+        """
+
+        return AnnotationView(self, members)
+
+# ========================================================================================
+
+class AnnotationView(object):
+
+    """
+    Read-only, dictionary-like view of the annotations of a set of
+    genes/transcripts (identifier -> list of annotation strings), backed by
+    an AnnotationIndex. Members without annotations map to [u""].
+    """
+
+    def __init__(self, annotindex, members):
+        self.annotindex = annotindex
+        self.members = list(members)
+        self.memberset = set(self.members)
+
+    def __getitem__(self, ident):
+        if ident not in self.memberset:
+            raise KeyError(ident)
+        if ident in self.annotindex:
+            return self.annotindex[ident]
+        return [u""]
+
+    def __contains__(self, ident):
+        return ident in self.memberset
+
+    def __iter__(self):
+        return iter(self.members)
+
+    def __len__(self):
+        return len(self.members)
+
+    def keys(self):
+        return list(self.members)
+
+    def items(self):
+        return [(k, self[k]) for k in self.members]
+
+    def get(self, ident, default=None):
+        if ident in self.memberset:
+            return self[ident]
+        return default
+
+# ========================================================================================
+
+def read_set_members(directory, f):
+
+    """
+    Reads the identifiers (first column) listed in a set file, in order and
+    without duplicates.
+    """
+
+    members = []
+    seen = set()
+
+    with profiling.stage("annotations"), open(os.path.join(directory, f)) as fh:
+        for line in fh:
+            ident = line.split("\t", 1)[0].strip()
+            if ident and ident not in seen:
+                seen.add(ident)
+                members.append(intern(ident))
+
+    return members
@@ -0,0 +1,133 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os, json, shutil
+
+from cache import file_digest, atomic_write, makedirs
+
+"""
+Local store of the BokehJS static files referenced by "batch" portability pages.
+"""
+
+# ========================================================================================
+
+STATIC = "static"
+MANIFEST = "manifest.json"
+
+# output roots already checked by this process
+READY = set()
+
+
+def bokeh_assets():
+
+    """
+    Returns (installed file, versioned name) pairs for the BokehJS script and
+    stylesheet shipped with the installed bokeh package.
+    """
+
+    import bokeh
+    from bokeh.resources import Resources
+
+    resources = Resources(mode="absolute")
+    pairs = []
+
+    for sources, ext in [(resources.js_files, "js"), (resources.css_files, "css")]:
+        for source in sources:
+            if os.path.basename(source) == "bokeh.min." + ext:
+                pairs.append((source, "bokeh-%s.min.%s" % (bokeh.__version__, ext)))
+
+    return pairs
+
+
+
+def asset_urls():
+
+    """
+    Relative (to the pages) urls of the local BokehJS script and stylesheet.
+    """
+
+    names = [name for source, name in bokeh_assets()]
+
+    return ([STATIC + "/" + n for n in names if n.endswith(".js")],
+            [STATIC + "/" + n for n in names if n.endswith(".css")])
+
+
+
+def ensure_assets(root):
+
+    """
+    Makes sure the output folder 'root' holds a copy of the BokehJS files under
+    static/. A manifest (static/manifest.json) records the size, mtime and
+    sha1 of every installed source and of its copy: files are only hashed when
+    their stats changed and only copied when the contents differ. Each output
+    root is checked once per process.
+    """
+
+    root = os.path.abspath(root)
+    if root in READY:
+        return
+
+    path = os.path.join(root, STATIC)
+    manifestfile = os.path.join(path, MANIFEST)
+
+    try:
+        with open(manifestfile) as fh:
+            manifest = json.load(fh)
+    except (IOError, ValueError):
+        manifest = {}
+
+    changed = False
+
+    for source, name in bokeh_assets():
+
+        target = os.path.join(path, name)
+        entry = manifest.get(name, {})
+
+        srcstat = stamp(source)
+        if unchanged(srcstat, entry.get("source")):
+            srcstat = entry["source"]
+        else:
+            srcstat["sha1"] = file_digest(source)
+
+        tgtstat = stamp(target)
+        if unchanged(tgtstat, entry.get("target")):
+            tgtstat = entry["target"]
+        elif tgtstat is not None:
+            tgtstat["sha1"] = file_digest(target)
+
+        if tgtstat is None or tgtstat["sha1"] != srcstat["sha1"]:
+            makedirs(path)
+            with open(source, "rb") as src:
+                atomic_write(target, lambda fh: shutil.copyfileobj(src, fh))
+            tgtstat = stamp(target)
+            tgtstat["sha1"] = srcstat["sha1"]
+
+        if entry != {"source": srcstat, "target": tgtstat}:
+            manifest[name] = {"source": srcstat, "target": tgtstat}
+            changed = True
+
+    if changed:
+        atomic_write(manifestfile, lambda fh: json.dump(manifest, fh, indent=1, sort_keys=True),
+                     mode="w")
+
+    READY.add(root)
+
+
+
+def stamp(path):
+
+    # size and mtime of a file, or None if it does not exist
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    return {"size": st.st_size, "mtime": st.st_mtime}
+
+
+
+def unchanged(current, recorded):
+
+    # whether a file's stats match the ones recorded (with its hash) in the manifest
+    return (current is not None and recorded is not None and "sha1" in recorded
+            and current["size"] == recorded.get("size") and current["mtime"] == recorded.get("mtime"))
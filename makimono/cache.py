@@ -0,0 +1,385 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os, re, json, hashlib, shutil
+import numpy as np
+
+from expression import ExpressionMatrix
+
+"""
+On-disk caches that allow results to be reused across makisu runs.
+"""
+
+# ========================================================================================
+
+def file_digest(path, blocksize=1 << 20):
+
+    """
+    Returns the sha1 hex digest of the contents of a file (read in blocks).
+    """
+
+    sha = hashlib.sha1()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(blocksize), b""):
+            sha.update(block)
+
+    return sha.hexdigest()
+
+# ========================================================================================
+
+def atomic_write(path, writer, mode="wb"):
+
+    """
+    Calls writer(filehandle) on a temporary file and moves it into place, so
+    concurrent readers never see a partially written file. If writer fails,
+    the temporary file is removed and whatever was at 'path' is left as it was.
+    """
+
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(tmp, mode) as fh:
+            writer(fh)
+        os.rename(tmp, path)
+    except:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+# ========================================================================================
+
+def makedirs(path):
+
+    # if not exists, create the cache folder
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+
+# ========================================================================================
+
+# entries (and the stat record) of earlier versions, not named after their file
+UNNAMED = re.compile(r"^([0-9a-f]{40}\.(npy|ids)|source\.json)$")
+
+class ExpressionCache(object):
+
+    """
+    Binary cache of parsed, replicate-averaged expression matrices. Each entry
+    is a .npy value array (memory-mapped on load) plus an identifiers file,
+    keyed on the expression file's size, mtime, content hash, the number of
+    replicates and the pseudocount added to the values. Only the latest entry
+    of every expression file is kept. By default entries are kept in a sidecar
+    folder next to the expression file (<expressionfile>.makimono/). Only
+    regular files are cached (not e.g. a pipe or standard input).
+    """
+
+    def __init__(self, cachedir=None):
+        self.cachedir = cachedir
+
+
+    def location(self, path):
+
+        if self.cachedir is not None:
+            return self.cachedir
+
+        return os.path.abspath(path) + ".makimono"
+
+
+    def cacheable(self, path):
+        return os.path.isfile(path)
+
+
+    def source(self, path):
+
+        # names the files of an expression file (its stat record and its entries)
+        return hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:16]
+
+
+    def prefix(self, path, reps, pseudocount=1):
+
+        # path of an entry, without the .npy/.ids extension
+        return os.path.join(self.location(path), "%s-%s" % (self.source(path),
+                                                            self.key(path, reps, pseudocount)))
+
+
+    def key(self, path, reps, pseudocount=1):
+
+        """
+        Builds the cache key for an expression file. The content hash is only
+        recomputed when the file's size or mtime differ from the ones recorded
+        on the previous run.
+        """
+
+        st = os.stat(path)
+
+        # (one stat record per source file, so that several expression files can
+        # share a cache folder without forcing each other to be re-hashed)
+        statfile = os.path.join(self.location(path), "source-%s.json" % self.source(path))
+
+        try:
+            with open(statfile) as fh:
+                source = json.load(fh)
+        except (IOError, ValueError):
+            source = {}
+
+        if (source.get("path") != os.path.abspath(path) or source.get("size") != st.st_size
+                or source.get("mtime") != st.st_mtime):
+
+            source = {"path": os.path.abspath(path), "size": st.st_size,
+                      "mtime": st.st_mtime, "sha1": file_digest(path)}
+            try:
+                makedirs(self.location(path))
+                atomic_write(statfile, lambda fh: json.dump(source, fh), mode="w")
+            except (IOError, OSError):
+                pass
+
+        token = "%d:%r:%s:%d:%r" % (source["size"], source["mtime"], source["sha1"], reps,
+                                    float(pseudocount))
+
+        return hashlib.sha1(token.encode("utf-8")).hexdigest()
+
+
+    def load(self, path, reps, pseudocount=1, keep=None):
+
+        """
+        Returns the cached ExpressionMatrix (values memory-mapped read-only)
+        for an expression file, or None if there is no valid entry. If 'keep'
+        (a set of identifiers) is supplied, only those rows are read out of the
+        memory-mapped values (in file order).
+        """
+
+        if not self.cacheable(path):
+            return None
+
+        prefix = self.prefix(path, reps, pseudocount)
+
+        try:
+            matrix = np.load(prefix + ".npy", mmap_mode="r")
+            with open(prefix + ".ids") as fh:
+                ids, rows, total = read_ids(fh, keep)
+        except (IOError, ValueError):
+            return None
+
+        if total != matrix.shape[0]:
+            return None
+
+        if rows is not None:
+            matrix = matrix[rows]
+
+        return ExpressionMatrix(ids, matrix)
+
+
+    def store(self, path, reps, data, pseudocount=1):
+
+        """
+        Writes an ExpressionMatrix to the cache, replacing the entries of the
+        expression file's earlier contents, replicates or pseudocounts. Failing
+        to write (e.g. a read-only data folder) is reported but never fatal.
+        """
+
+        if not self.cacheable(path):
+            return
+
+        location = self.location(path)
+
+        try:
+            prefix = self.prefix(path, reps, pseudocount)
+            makedirs(location)
+            atomic_write(prefix + ".ids", lambda fh: fh.write("\n".join(data.ids)), mode="w")
+            atomic_write(prefix + ".npy", lambda fh: np.save(fh, data.matrix))
+        except (IOError, OSError) as e:
+            print "Could not cache expression values in %s (%s)" % (location, e)
+            return
+
+        # (the other entries of the file, and those written before entries were named
+        # after their file, which are never loaded again; other files' entries stay)
+        current = os.path.basename(prefix) + "."
+        for f in os.listdir(location):
+            if ((f.startswith(self.source(path) + "-") and not f.startswith(current))
+                    or UNNAMED.match(f)):
+                try:
+                    os.remove(os.path.join(location, f))
+                except OSError:
+                    pass
+
+
+
+def read_ids(fh, keep=None):
+
+    """
+    Reads an identifiers file (one per line): returns the identifiers listed
+    in 'keep' and their row numbers (all of them, and None, without 'keep'),
+    and the total number of identifiers in the file.
+    """
+
+    if keep is None:
+        ids = fh.read().split("\n")
+        if len(ids) == 1 and ids[0] == "":
+            ids = []
+        return ids, None, len(ids)
+
+    ids, rows, total = [], [], 0
+    for total, line in enumerate(fh, 1):
+        ident = line.rstrip("\n")
+        if ident in keep:
+            ids.append(ident)
+            rows.append(total - 1)
+
+    return ids, np.array(rows, dtype=np.intp), total
+
+# ========================================================================================
+
+class ResultCache(object):
+
+    """
+    Content-addressed cache of enrichment result files (<basename>_enrichment.tsv).
+    Entries are keyed on the sorted target identifiers, the mappings file's
+    contents, the ontology/KEGG organism and alpha, so an unchanged set is never
+    sent through R twice. Sets that had no genes mapped (so no result file) are
+    remembered as such, by an empty marker entry. The folder is kept under
+    'maxbytes' by evicting the least recently used entries: it is only scanned
+    on the first store and when the running total of the sizes stored since
+    goes over the limit (so the writes of other processes sharing the folder
+    are only counted then). Hits and misses are counted per instance (see stats).
+    """
+
+    def __init__(self, cachedir, maxbytes=256 * 1024 * 1024):
+        self.cachedir = os.path.expanduser(cachedir)
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self._digests = {}
+        self._size = None       # size of the folder's entries (None: not scanned yet)
+
+
+    def mappings_digest(self, path):
+
+        """
+        Returns the content hash of a mappings file (hashed once per size/mtime).
+        """
+
+        st = os.stat(path)
+        stamp = (st.st_size, st.st_mtime)
+
+        if path not in self._digests or self._digests[path][0] != stamp:
+            self._digests[path] = (stamp, file_digest(path))
+
+        return self._digests[path][1]
+
+
+    def key(self, genes, mappings, category, alpha):
+
+        """
+        Builds the cache key of an enrichment: 'category' identifies the kind of
+        test (e.g. "GO BP" or "KEGG cre").
+        """
+
+        sha = hashlib.sha1()
+        sha.update("\n".join(sorted(set(genes))).encode("utf-8"))
+        sha.update(("\0%s\0%s\0%r" % (self.mappings_digest(mappings), category, alpha)).encode("utf-8"))
+
+        return sha.hexdigest()
+
+
+    def fetch(self, key, outname):
+
+        """
+        Materializes a cached result at 'outname' (or, for a set known to have
+        no result, removes any file left there). Returns False (a miss) if there
+        is no entry for the key.
+        """
+
+        entry = os.path.join(self.cachedir, key + ".tsv")
+
+        try:
+            with open(entry, "rb") as src:
+                atomic_write(outname, lambda fh: shutil.copyfileobj(src, fh))
+        except IOError:
+            entry = os.path.join(self.cachedir, key + ".none")
+            if not os.path.isfile(entry):
+                self.misses += 1
+                return False
+            try:
+                os.remove(outname)
+            except OSError:
+                pass
+
+        os.utime(entry, None)    # marks it as recently used
+        self.hits += 1
+
+        return True
+
+
+    def store(self, key, outname=None):
+
+        """
+        Stores a freshly computed result file in the cache or, without one (the
+        set had no genes mapped), an empty ".none" marker.
+        """
+
+        entry = os.path.join(self.cachedir, key + (".tsv" if outname is not None else ".none"))
+
+        try:
+            makedirs(self.cachedir)
+            previous = file_size(entry)
+            if outname is not None:
+                with open(outname, "rb") as src:
+                    atomic_write(entry, lambda fh: shutil.copyfileobj(src, fh))
+            else:
+                atomic_write(entry, lambda fh: None)
+        except (IOError, OSError) as e:
+            print "Could not cache enrichment result in %s (%s)" % (self.cachedir, e)
+            return
+
+        if self._size is None:
+            self.evict()
+        else:
+            self._size += file_size(entry) - previous
+            if self._size > self.maxbytes:
+                self.evict()
+
+
+    def evict(self):
+
+        """
+        Removes least recently used entries until the cache fits in maxbytes
+        (and records the size of what is left).
+        """
+
+        entries = []
+        for f in os.listdir(self.cachedir):
+            if f.endswith(".tsv") or f.endswith(".none"):
+                try:
+                    st = os.stat(os.path.join(self.cachedir, f))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, f))
+
+        entries.sort()
+        total = sum(size for mtime, size, f in entries)
+
+        for mtime, size, f in entries:
+            if total <= self.maxbytes:
+                break
+            try:
+                os.remove(os.path.join(self.cachedir, f))
+            except OSError:
+                pass
+            total -= size
+
+        self._size = total
+
+
+    def stats(self):
+
+        return {"hits": self.hits, "misses": self.misses}
+
+
+
+def file_size(path):
+
+    # (0 for a missing file)
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
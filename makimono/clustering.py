@@ -0,0 +1,195 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import codecs
+import numpy as np
+from collections import OrderedDict
+
+import profiling
+from transform import apply_chain
+
+"""
+K-means clustering of expression profiles (NumPy only), to build gene/transcript
+sets straight from an ExpressionMatrix instead of from set files.
+"""
+
+# ========================================================================================
+
+# profiles are compared on their shape (z-score of the log values) by default
+SCALES = ["log", "zscore"]
+CHUNKSIZE = 65536
+
+def profile_features(matrix, scale="zscore"):
+
+    """
+    Returns the values clustering works on: the log of the (pseudocounted)
+    expression values or, with "zscore", each log profile centered on its mean
+    and divided by its standard deviation (flat profiles become all zeros), so
+    that genes/transcripts are grouped by the shape of their profiles rather
+    than by their expression level.
+    """
+
+    if scale not in SCALES:
+        raise ValueError("Unknown profile scale '%s' (expected one of %s)!" % (scale, ", ".join(SCALES)))
+
+    if scale == "zscore":
+        return apply_chain(matrix, ["ln", "zscore"])
+
+    return apply_chain(matrix, ["ln"])
+
+
+
+def nearest_centers(features, centers, chunksize=CHUNKSIZE):
+
+    """
+    Assigns every row to its nearest center (squared euclidean distance),
+    computing the (rows x centers) distances one chunk of rows at a time.
+    Returns the labels and the squared distances to the assigned centers.
+    """
+
+    labels = np.empty(len(features), dtype=np.intp)
+    distances = np.empty(len(features))
+    csq = (centers ** 2).sum(axis=1)
+
+    for start in range(0, len(features), chunksize):
+        chunk = features[start:start + chunksize]
+        d = (chunk ** 2).sum(axis=1)[:, None] - 2 * np.dot(chunk, centers.T) + csq
+        labels[start:start + chunksize] = d.argmin(axis=1)
+        distances[start:start + chunksize] = d[np.arange(len(chunk)), labels[start:start + chunksize]]
+
+    # (rounding can make distances of identical rows slightly negative)
+    return labels, np.maximum(distances, 0)
+
+
+
+def initial_centers(features, k, rs, chunksize=CHUNKSIZE):
+
+    """
+    k-means++ seeding: every new center is drawn with probability proportional
+    to the squared distance to the nearest center chosen so far.
+    """
+
+    centers = np.empty((k, features.shape[1]))
+    centers[0] = features[rs.randint(len(features))]
+    closest = nearest_centers(features, centers[:1], chunksize)[1]
+
+    for i in range(1, k):
+        total = closest.sum()
+        if total > 0:
+            pick = np.searchsorted(np.cumsum(closest), rs.uniform(0, total))
+        else:
+            pick = rs.randint(len(features))
+        centers[i] = features[min(pick, len(features) - 1)]
+        closest = np.minimum(closest, nearest_centers(features, centers[i:i + 1], chunksize)[1])
+
+    return centers
+
+
+
+def kmeans(features, k, iterations=100, tolerance=1e-6, seed=0, chunksize=CHUNKSIZE):
+
+    """
+    Lloyd's k-means on the rows of 'features' (k-means++ seeding). Each
+    iteration assigns the rows in chunks (see nearest_centers) and recomputes the
+    centers with one bincount per column; a cluster left empty is re-seeded
+    with the row farthest from its center. Stops when no row changes cluster or
+    the centers move less than 'tolerance'. Returns (labels, centers, inertia).
+    """
+
+    features = np.asarray(features, dtype=np.float64)
+    n = len(features)
+
+    if not 0 < k <= n:
+        raise ValueError("Cannot make %d clusters out of %d profiles!" % (k, n))
+
+    finite = np.isfinite(features).all(axis=1)
+    if not finite.all():
+        raise ValueError("Cannot cluster %d profile(s) with non-finite values (the log of zero "
+                         "expression values, with a zero pseudocount?)!" % (~finite).sum())
+
+    rs = np.random.RandomState(seed)
+    centers = initial_centers(features, k, rs, chunksize)
+    labels = None
+
+    for iteration in range(iterations):
+        previous = labels
+        labels, distances = nearest_centers(features, centers, chunksize)
+
+        if previous is not None and np.array_equal(labels, previous):
+            break
+
+        counts = np.bincount(labels, minlength=k)
+        sums = np.column_stack([np.bincount(labels, weights=features[:, j], minlength=k)
+                                for j in range(features.shape[1])])
+
+        updated = centers.copy()
+        filled = counts > 0
+        updated[filled] = sums[filled] / counts[filled][:, None]
+
+        for empty in np.nonzero(~filled)[0]:
+            far = distances.argmax()
+            updated[empty] = features[far]
+            distances[far] = 0
+
+        shift = ((updated - centers) ** 2).sum()
+        centers = updated
+
+        if shift < tolerance:
+            break
+
+    # (the labels and inertia of the final centers)
+    labels, distances = nearest_centers(features, centers, chunksize)
+
+    return labels, centers, float(distances.sum())
+
+# ========================================================================================
+
+def cluster_name(i):
+
+    # same "NNN_" prefix as the ClusterSeq set files (see toolbox.process_title)
+    return "%03d_cluster" % i
+
+
+
+def cluster_sets(data, k, scale="zscore", seed=0, iterations=100, chunksize=CHUNKSIZE):
+
+    """
+    Clusters the profiles of an ExpressionMatrix into 'k' sets, returned as an
+    (ordered, largest first) set name -> list of identifiers dictionary that can
+    be rendered like the sets read from files.
+    """
+
+    if len(data) == 0:
+        raise ValueError("There are no expression profiles to cluster!")
+
+    with profiling.stage("clustering"):
+        labels = kmeans(profile_features(data.matrix, scale), k, iterations=iterations, seed=seed,
+                        chunksize=chunksize)[0]
+
+    counts = np.bincount(labels, minlength=k)
+    order = np.argsort(-counts, kind="mergesort")
+    ids = np.array(data.ids, dtype=object)
+
+    # members of every cluster, in their matrix order
+    members = np.split(ids[np.argsort(labels, kind="mergesort")], np.cumsum(counts)[:-1])
+
+    sets = OrderedDict()
+    for i, label in enumerate(order):
+        if counts[label] > 0:
+            sets[cluster_name(i)] = members[label].tolist()
+
+    return sets
+
+
+
+def write_cluster_table(path, sets):
+
+    """
+    Writes the membership of a set name -> identifiers dictionary as a single
+    tab-separated file: identifier, set name.
+    """
+
+    with codecs.open(path, encoding='latin-1', mode="w") as fh:
+        for name, members in sets.items():
+            for ident in members:
+                fh.write(u"%s\t%s\n" % (ident, name))
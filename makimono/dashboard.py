@@ -0,0 +1,149 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os, json, codecs, urllib
+import numpy as np
+
+import templater
+import profiling
+from cache import atomic_write, makedirs
+
+"""
+Dashboard output: a single index page and set view for a whole run, with the
+expression values of every gene/transcript written only once.
+"""
+
+# ========================================================================================
+
+DATA = "data"
+
+class Dashboard(object):
+
+    """
+    Collects the sets of a run and writes them out as a dashboard:
+
+        index.html              list of sets (name, size, available enrichments)
+        view.html#<set name>    plot, enrichment and annotation tables of a set
+        data/expression.js      time points, identifiers, annotations and values of
+                                every gene/transcript found in any set
+        data/sets.js            the sets: members as row indices into expression.js,
+                                enrichment tables
+
+    The views are drawn client-side (in SVG) from the shared data files, so the
+    output grows with the number of distinct genes/transcripts rather than with
+    the sum of set sizes, and no page needs BokehJS. The values are written as
+    they are (transformed beforehand, see makimono.transform), and the plots'
+    y-axis is labelled 'ylabel'.
+    """
+
+    def __init__(self, data, timepoints, ticks, ylabel="normalized expression counts"):
+        self.data = data
+        self.timepoints = [float(x) for x in timepoints]
+        self.ticks = ticks
+        self.ylabel = ylabel
+
+        self.rows = {}          # identifier -> row in expression.js
+        self.ids = []
+        self.annotations = []
+        self.sets = []
+
+
+    def add_set(self, name, members, annots=None, plus=None):
+
+        """
+        Adds a set: its members (all of them must be in the expression data), an
+        optional identifier -> annotations mapping and the (optional) enrichment
+        dataframes of process_enrichment_values.
+        """
+
+        members = list(members)
+        self.data.rows(members)     # raises KeyError for unknown identifiers
+
+        rows = []
+        for gene in members:
+            if gene not in self.rows:
+                self.rows[gene] = len(self.ids)
+                self.ids.append(gene)
+                self.annotations.append(u"")
+
+            row = self.rows[gene]
+            if annots is not None and self.annotations[row] == u"":
+                self.annotations[row] = annots[gene][0].strip()
+            rows.append(row)
+
+        entry = {"name": name, "rows": rows}
+        if plus is not None:
+            entry["enrichment"] = enrichment_tables(plus)
+
+        self.sets.append(entry)
+
+
+    def write(self, savelocation):
+
+        """
+        Writes the dashboard pages and data files into 'savelocation'.
+        """
+
+        with profiling.stage("writing"):
+            self.write_files(savelocation)
+
+
+    def write_files(self, savelocation):
+
+        datapath = os.path.join(savelocation, DATA)
+        makedirs(datapath)
+
+        values = self.data.matrix[self.data.rows(self.ids)] if self.ids else []
+        expression = {"timepoints": self.timepoints,
+                      "ticks": [str(t) for t in self.ticks],
+                      "ylabel": self.ylabel,
+                      "ids": self.ids,
+                      "annotations": self.annotations,
+                      "values": np.round(values, 4).tolist()}
+
+        write_script(os.path.join(datapath, "expression.js"), "MAKIMONO.expression", expression)
+        write_script(os.path.join(datapath, "sets.js"), "MAKIMONO.sets", self.sets)
+
+        overview = [{"name": s["name"], "size": len(s["rows"]),
+                     "link": "view.html#" + urllib.quote(s["name"].encode("utf-8")),
+                     "enrichment": sorted(k for k, v in s.get("enrichment", {}).items() if v is not None)}
+                    for s in self.sets]
+
+        for page, context in [("index.html", {"sets": overview, "genes": len(self.ids)}),
+                              ("view.html", {})]:
+            template = templater.ENV.get_template("dashboard_" + page)
+            atomic_write(os.path.join(savelocation, page),
+                         lambda fh: template.stream(**context).dump(codecs.getwriter('latin-1')(fh)))
+
+
+# accessory helpers
+# -------------------------------------------------------------------------
+
+def enrichment_tables(plus):
+
+    """
+    Converts the enrichment dataframes of a set into html tables (as shown on
+    the bokehplus pages); ontologies without results map to None.
+    """
+
+    tables = templater.Templater(None, None, None, {}).process_enrichment_dict(
+        plus['bp'], plus['mf'], plus['cc'], plus['kegg'], plus['alpha'])
+
+    return dict((key, table if plus[key] is not None else None)
+                for key, table in zip(['bp', 'mf', 'cc', 'kegg'], tables))
+
+
+
+def write_script(path, variable, value):
+
+    """
+    Writes a value as a javascript assignment, so that pages opened from the
+    local filesystem can load it with a plain <script> tag.
+    """
+
+    def writer(fh):
+        fh.write("var MAKIMONO = MAKIMONO || {};\n%s = " % variable)
+        json.dump(value, fh, separators=(",", ":"))
+        fh.write(";\n")
+
+    atomic_write(path, writer, mode="w")
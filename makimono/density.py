@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+"""
+Aggregate (density) summaries of large sets of expression profiles: drawing them
+costs as much as the number of bins, whatever the number of genes/transcripts.
+"""
+
+# ========================================================================================
+
+# sets larger than this are drawn as a density instead of one line per profile
+AGGREGATE_THRESHOLD = 5000
+DENSITY_BINS = 100
+
+# (lower, upper) percentiles of the shaded bands; the median is drawn as a line
+BANDS = [(5, 95), (25, 75)]
+
+# ========================================================================================
+
+def profile_density(values, bins=DENSITY_BINS, span=None):
+
+    """
+    Bins the values of every profile (rows) at every time point (columns) into
+    a (bins x time points) count matrix, in a single pass. Returns the counts
+    and the bin edges (bins + 1) along the value axis; 'span' fixes the
+    (min, max) binned range, otherwise the range of the finite values is used.
+    Non-finite values and values outside the span are left out.
+    """
+
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values.reshape(1, -1)
+
+    ntp = values.shape[1]
+    finite = np.isfinite(values)
+
+    if span is None:
+        if finite.any():
+            span = (values[finite].min(), values[finite].max())
+        else:
+            span = (0.0, 1.0)
+
+    low, high = float(span[0]), float(span[1])
+    if high <= low:
+        high = low + 1.0
+
+    edges = np.linspace(low, high, bins + 1)
+
+    inside = finite.copy()
+    inside[finite] = (values[finite] >= low) & (values[finite] <= high)
+    position = np.zeros(values.shape, dtype=np.intp)
+    position[inside] = np.minimum(((values[inside] - low) / (high - low) * bins).astype(np.intp),
+                                  bins - 1)
+
+    # flat (bin, time point) cell index -> one bincount for the whole matrix
+    cells = position * ntp + np.arange(ntp)
+    counts = np.bincount(cells[inside], minlength=bins * ntp).reshape(bins, ntp)
+
+    return counts, edges
+
+
+
+def percentile_bands(values):
+
+    """
+    Returns the per time point percentiles used by the aggregate plots, as a
+    dictionary percentile -> array (the 50th being the median).
+    """
+
+    values = np.asarray(values, dtype=float)
+    percents = sorted(set([p for band in BANDS for p in band] + [50]))
+
+    if values.shape[0] == 0:
+        return dict((p, np.zeros(values.shape[1])) for p in percents)
+
+    values = np.where(np.isfinite(values), values, np.nan)
+    table = np.nanpercentile(values, percents, axis=0)
+
+    return dict(zip(percents, table))
+
+
+
+def time_edges(timepoints):
+
+    """
+    Cell boundaries along the time axis: halfway between consecutive time
+    points, and as wide as the neighbouring half-cells at both ends.
+    """
+
+    tp = np.asarray(timepoints, dtype=float)
+
+    if len(tp) == 1:
+        return np.array([tp[0] - 0.5, tp[0] + 0.5])
+
+    mids = (tp[1:] + tp[:-1]) / 2.0
+
+    return np.concatenate([[tp[0] - (mids[0] - tp[0])], mids, [tp[-1] + (tp[-1] - mids[-1])]])
+
+
+
+def profile_matrix(subset, genes=None):
+
+    """
+    Returns the (genes x time points) values of a subset (an ExpressionMatrix
+    or an identifier -> values dictionary), optionally restricted to 'genes'.
+    """
+
+    if genes is None and hasattr(subset, "matrix"):
+        return np.asarray(subset.matrix, dtype=float)
+
+    if genes is None:
+        genes = list(subset.keys())
+
+    if len(genes) == 0:
+        return np.zeros((0, 0))
+
+    return np.array([subset[gene] for gene in genes], dtype=float).reshape(len(genes), -1)
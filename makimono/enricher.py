@@ -5,28 +5,46 @@ import os
 import rpy2.robjects as robjects
 from rpy2.robjects.packages import importr
 
+from overrep import read_target_group, result_path
+
 
 # NOTE: The methods here that are interfacing with with R here could use some
 #       - input validation, exception handling (currently there's litte & crude).
 
-#TODO: Need to re-write these classes because right now I am using the globalenv
-#      to store variables, and that is leading to issues, when "crossing" objects
-#      from different methods. 
+# NOTE: Each enrichment object evaluates its R code in its own environment, whose
+#       parent holds the (shared, read-once) mappings for its mappings file; nothing
+#       is stored in the R globalenv, so objects no longer "cross" each other.
 
 # ===============================================================================
 
 class KEGGer(object):
 
 
-    def __init__(self, keggmap, alpha, organism):
+    def __init__(self, keggmap, alpha, organism, cache=None):
 
         self.mappings = keggmap
         self.alpha = alpha
         self.organism = organism
+        self.cache = cache
+
+        # built on the first set that is not found in the cache (see environment)
+        self.env = None
+
+
+    def environment(self):
+
+        """
+        Returns the R environment the enrichments run in, loading the R packages
+        and the KEGG collection (see kegg_collection) the first time.
+        """
+
+        if self.env is None:
+            load_packages('KEGG.db', 'GOstats', 'GSEABase')
+
+            self.env = new_environment(kegg_collection(self.mappings, self.organism))
+            self.env["alpha"] = self.alpha
 
-        KEGGdb = importr('KEGG.db')
-        GOstats = importr('GOstats')
-        GSEABase = importr('GSEABase')
+        return self.env
 
 
     def perform_kegg_enrichment(self, targetspath):
@@ -36,43 +54,61 @@ class KEGGer(object):
         suplied list of genes/transcripts of interest, saving results to file.
         """
 
-        robjects.globalenv["mappings"] = self.mappings
-        robjects.globalenv["alpha"] = self.alpha
-        robjects.globalenv["organism"] = self.organism
+        self.enrich_many([targetspath])
+
+
+    def enrich_many(self, targetpaths):
+
+        """
+        Uses the R GOstats package to calculate KEGG pathway enrichment for
+        several lists of genes/transcripts of interest, saving results to file.
+        The mappings, KEGGFrame, GeneSetCollection and universe are built once
+        and reused for every list (in the same R session). Lists found in the
+        result cache (if any) are not sent through R; if all of them are found,
+        neither the R packages nor the mappings are loaded.
+        """
+
+        for targetspath in targetpaths:
 
+            genes = read_target_group(targetspath)
+            basename, outname = result_path(targetspath, "keggenrich/")
 
-        read_target_group_of_interest(targetspath)
+            if self.cache is not None:
+                key = self.cache.key(genes, self.mappings, "KEGG "+self.organism, self.alpha)
+                if self.cache.fetch(key, outname):
+                    continue
+                discard_result(outname)
 
-        handle_result_saving(targetspath, "keggenrich/")
+            bind_target(self.environment(), genes, basename, outname)
 
-        robjects.r('''tryCatch(
-                      {
-                        KEGGmap <- read.csv(mappings, sep="\t", colClasses=
-                                      c("character", "character"), header=FALSE)
-                        colnames(KEGGmap) <- c("path_id", "gene_id")
-                        keggFrame=KEGGFrame(KEGGmap,organism=organism)
-                        gsc <- GeneSetCollection(keggFrame, setType = 
-                                      KEGGCollection())
-                        universe <- unique(KEGGmap[,2])
-                        universe <- unlist(as.character(universe))
+            evaluate('''
+                          status <- if (any(targetset %in% universe)) "mapped" else "unmapped"
 
-                        kparams <- GSEAKEGGHyperGParams(
-                                    name="Custom GSEA based params",
-                                    geneSetCollection=gsc,
-                                    geneIds = targetset,
-                                    universeGeneIds = universe,
-                                    pvalueCutoff = alpha,
-                                    testDirection = "over")
+                          if (status == "unmapped") {
+                            print( paste(basename, " failed to have any KEGG pathways mapped to its members!") )
+                          } else tryCatch(
+                          {
+                            kparams <- GSEAKEGGHyperGParams(
+                                        name="Custom GSEA based params",
+                                        geneSetCollection=gsc,
+                                        geneIds = targetset,
+                                        universeGeneIds = universe,
+                                        pvalueCutoff = alpha,
+                                        testDirection = "over")
 
-                        kOver <- hyperGTest(kparams)
-                        enrichRes <- summary(kOver)
+                            kOver <- hyperGTest(kparams)
+                            enrichRes <- summary(kOver)
 
-                        write.table(enrichRes, file = outname, sep = "\t", 
-                           row.names = FALSE, quote = FALSE)
+                            write.table(enrichRes, file = outname, sep = "\t", 
+                               row.names = FALSE, quote = FALSE)
 
-                      }, error = function(e){ print( paste(basename, " failed to have any KEGG pathways mapped to its members!") ) }
-                      )
-        ''')
+                            status <- "written"
+
+                          }, error = function(e){ print( paste(basename, "KEGG enrichment failed:", conditionMessage(e)) ) }
+                          )
+            ''', self.env)
+
+            store_result(self.cache, key, outname, self.env)
 
 
 # =====================================================================================================================================
@@ -81,13 +117,32 @@ class GOrich(object):
 
     # NOTE: alpha parameter is not currently been used, here.
     #       Check possibily of using it as a filter later.
-    def __init__(self, gomap, ontology, alpha):
+    def __init__(self, gomap, ontology, alpha, cache=None):
 
         self.mappings = gomap
         self.ontology = ontology
         self.alpha = alpha
+        self.cache = cache
+
+        # built on the first set that is not found in the cache (see environment)
+        self.env = None
+
+
+    def environment(self):
+
+        """
+        Returns the R environment the enrichments run in, loading topGO and the
+        (shared) gene2GO mappings (see go_mappings) the first time.
+        """
+
+        if self.env is None:
+            load_packages('topGO')
 
-        topGO = importr('topGO')
+            self.env = new_environment(go_mappings(self.mappings))
+            self.env["ontology"] = self.ontology
+            self.env["alpha"] = self.alpha
+
+        return self.env
 
 
     def perform_go_enrichment(self, targetspath):
@@ -97,90 +152,117 @@ class GOrich(object):
         lists of genes/transcripts of interest, saving results to file.
         """
 
-        robjects.globalenv["mappings"] = self.mappings
-        robjects.globalenv["ontology"] = self.ontology
-        robjects.globalenv["alpha"] = self.alpha
+        self.enrich_many([targetspath])
+
 
-        read_target_group_of_interest(targetspath)
+    def enrich_many(self, targetpaths):
 
-        handle_result_saving(targetspath, "goenrich/"+self.ontology)
+        """
+        Uses the R topGO package to calculate GO term enrichment for several
+        lists of genes/transcripts of interest, saving results to file. The
+        gene2GO mappings are read once per R session (and shared by GOrich
+        objects of the other ontologies) and the topGOdata object is built
+        once, then updated with each list's genes of interest. Lists found in
+        the result cache (if any) are not sent through R; if all of them are
+        found, neither the R packages nor the mappings are loaded.
+        """
 
+        for targetspath in targetpaths:
 
-        robjects.r('''
-        capture.output(id2go <- readMappings(file = mappings), file="/dev/null")
-        transcriptNames <- names(id2go)
+            genes = read_target_group(targetspath)
+            basename, outname = result_path(targetspath, "goenrich/"+self.ontology)
 
-        interestingGenes <- factor(as.integer( transcriptNames %in% as.character(unlist(targetset)) ) )
-        names(interestingGenes) <- transcriptNames
+            if self.cache is not None:
+                key = self.cache.key(genes, self.mappings, "GO "+self.ontology, self.alpha)
+                if self.cache.fetch(key, outname):
+                    continue
+                discard_result(outname)
 
-        success = FALSE
-        ''')
+            bind_target(self.environment(), genes, basename, outname)
 
+            evaluate('''
+            interestingGenes <- factor(as.integer( transcriptNames %in% as.character(unlist(targetset)) ) )
+            names(interestingGenes) <- transcriptNames
 
-        robjects.r('''
-                      tryCatch(
-                      {
-                      capture.output(               
-                        GOdata <- new("topGOdata", ontology = ontology,
-                        allGenes = interestingGenes, annot = annFUN.gene2GO, 
-                        gene2GO = id2go)
-                      , file="/dev/null" )
+            status <- if (any(transcriptNames %in% targetset)) "mapped" else "unmapped"
+            ''', self.env)
 
-                      success <- TRUE
-                      }, 
 
-                      error = function(e){ 
-                                print( paste(basename, "failed to have any GO", ontology, "terms mapped to its members!") )
-                                success <- FALSE 
-                                }
-                      )
-                   ''')
+            evaluate('''
+                          if (status == "unmapped") {
+                            print( paste(basename, "failed to have any GO", ontology, "terms mapped to its members!") )
+                          } else tryCatch(
+                          {
+                          if (!exists("GOdataBase", inherits = FALSE)) {
+                            capture.output(               
+                              GOdata <- new("topGOdata", ontology = ontology,
+                              allGenes = interestingGenes, annot = annFUN.gene2GO, 
+                              gene2GO = id2go)
+                            , file="/dev/null" )
 
+                            GOdataBase <- GOdata
+                          } else {
+                            capture.output(
+                              GOdata <- updateGenes(GOdataBase, interestingGenes)
+                            , file="/dev/null" )
+                          }
 
-        robjects.r('''
-                  if (success == TRUE){
-                      capture.output(
-                          resultFisher <- runTest(GOdata, algorithm = "classic", 
-                          statistic = "fisher")
-                      , file="/dev/null" )
+                          status <- "built"
+                          }, 
 
-                      capture.output(
-                          resultFisher.Elim <- runTest(GOdata, algorithm = "elim",
-                          statistic = "fisher")
-                      , file="/dev/null" )
+                          error = function(e){ 
+                                    print( paste(basename, "GO", ontology, "enrichment failed:", conditionMessage(e)) )
+                                    }
+                          )
+                       ''', self.env)
 
-                      enrichRes <- GenTable(GOdata, classicFisher = resultFisher, 
-                                 elimFisher = resultFisher.Elim, orderBy = "elimFisher", 
-                                 ranksOf ="classicFisher", topNodes = 30)
 
-                      write.table(enrichRes, file = outname, sep = "\t", row.names = FALSE,
-                                  quote = FALSE)
-                  }
-                   ''')
+            evaluate('''
+                      if (status == "built"){
+                          capture.output(
+                              resultFisher <- runTest(GOdata, algorithm = "classic", 
+                              statistic = "fisher")
+                          , file="/dev/null" )
+
+                          capture.output(
+                              resultFisher.Elim <- runTest(GOdata, algorithm = "elim",
+                              statistic = "fisher")
+                          , file="/dev/null" )
+
+                          enrichRes <- GenTable(GOdata, classicFisher = resultFisher, 
+                                     elimFisher = resultFisher.Elim, orderBy = "elimFisher", 
+                                     ranksOf ="classicFisher", topNodes = 30)
+
+                          write.table(enrichRes, file = outname, sep = "\t", row.names = FALSE,
+                                      quote = FALSE)
+
+                          status <- "written"
+                      }
+                       ''', self.env)
+
+            store_result(self.cache, key, outname, self.env)
 
 
 # accessory py2r helpers
 # -------------------------------------------------------------------------
 
-def read_target_group_of_interest(targetspath):
+def read_target_group_of_interest(targetspath, env=robjects.globalenv):
 
     """
     Reads a tsv file, extracts the first column (while assuming they
-    are transcript/gene identifiers) and sets them as a vector in R
-    global environament.
+    are transcript/gene identifiers) and sets them as a vector in an
+    R environment (the global one by default). Returns the identifiers.
     """
 
-    genes = []
-    with open(targetspath) as fh:
-        for line in fh:
-            token = line.split("\t")
-            genes.append(token[0].strip())
+    genes = read_target_group(targetspath)
+
+    env["targetset"] = robjects.StrVector(genes)
 
-    robjects.globalenv["targetset"] = robjects.StrVector(genes)
+    return genes
 
 
 
-def handle_result_saving(targetspath, enrich):
+def handle_result_saving(targetspath, enrich, env=robjects.globalenv):
 
     """
     Creates folder to save enrichment results (if there is not one
@@ -188,18 +270,142 @@ def handle_result_saving(targetspath, enrich):
     """
 
     # SAVE IT TO DISK
-    basename = os.path.splitext(os.path.basename(targetspath))[0]
-    foldername = os.path.dirname(targetspath)
+    basename, outname = result_path(targetspath, enrich)
+
+    env["basename"] = basename
+    env["outname"] = outname
+
+    return outname
+
+
+
+def bind_target(env, genes, basename, outname):
+
+    """
+    Sets a list's identifiers, basename and result file path in an R
+    environment (as read_target_group_of_interest and handle_result_saving do).
+    """
+
+    env["targetset"] = robjects.StrVector(genes)
+    env["basename"] = basename
+    env["outname"] = outname
+
+
 
-    robjects.globalenv["basename"] = basename
+def discard_result(outname):
 
-    outname = os.path.join(foldername, enrich, basename+"_enrichment.tsv")
-    robjects.globalenv["outname"] = outname
+    """
+    Removes a previous result file, so that a failed run cannot leave a stale
+    result behind (to be cached as if it were the new one).
+    """
 
-    # if not exists, create folder to save enrichment results
-    savepath = os.path.join(foldername, enrich)
-    try: 
-        os.makedirs(savepath)
+    try:
+        os.remove(outname)
     except OSError:
-        if not os.path.isdir(savepath):
-            raise
+        pass
+
+
+
+def store_result(cache, key, outname, env):
+
+    """
+    Caches the outcome of an enrichment after the 'status' its R code left in
+    the environment: "written" (a result file), "unmapped" (none of the genes
+    are mapped: no result file). Anything else failed; its (partial) result
+    file is removed and nothing is cached, so that the set is run again next
+    time.
+    """
+
+    status = evaluate("status", env)[0]
+
+    if status not in ("written", "unmapped"):
+        discard_result(outname)
+    elif cache is not None:
+        cache.store(key, outname if status == "written" else None)
+
+
+
+def evaluate(code, env):
+
+    """
+    Evaluates a chunk of R code in the given R environment.
+    """
+
+    return robjects.r['eval'](robjects.r['parse'](text=code), envir=env)
+
+
+
+def load_packages(*names):
+
+    """
+    Loads R packages into the R session, each one only the first time it is
+    asked for (constructing several enrichment objects does not reload them).
+    """
+
+    for name in names:
+        if name not in PACKAGES:
+            PACKAGES[name] = importr(name)
+
+
+
+def new_environment(parent=robjects.globalenv):
+
+    return robjects.r['new.env'](parent=parent)
+
+
+# R packages already loaded in this R session (see load_packages)
+PACKAGES = {}
+
+# Environments holding the mappings already read in this R session (so that,
+# for instance, GOrich objects for BP, MF and CC share a single id2go).
+SHARED = {}
+
+def go_mappings(gomap):
+
+    """
+    Returns the (shared) R environment holding the gene2GO mappings read from
+    a topGO mappings file, reading it only the first time.
+    """
+
+    key = ("GO", gomap)
+
+    if key not in SHARED:
+        env = new_environment()
+        env["mappings"] = gomap
+        evaluate('''
+        capture.output(id2go <- readMappings(file = mappings), file="/dev/null")
+        transcriptNames <- names(id2go)
+        ''', env)
+        SHARED[key] = env
+
+    return SHARED[key]
+
+
+
+def kegg_collection(keggmap, organism):
+
+    """
+    Returns the (shared) R environment holding the KEGG GeneSetCollection and
+    universe built from a mappings file for an organism, building them only
+    the first time.
+    """
+
+    key = ("KEGG", keggmap, organism)
+
+    if key not in SHARED:
+        env = new_environment()
+        env["mappings"] = keggmap
+        env["organism"] = organism
+        evaluate('''
+        KEGGmap <- read.csv(mappings, sep="\t", colClasses=
+                      c("character", "character"), header=FALSE)
+        colnames(KEGGmap) <- c("path_id", "gene_id")
+        keggFrame=KEGGFrame(KEGGmap,organism=organism)
+        gsc <- GeneSetCollection(keggFrame, setType = 
+                      KEGGCollection())
+        universe <- unique(KEGGmap[,2])
+        universe <- unlist(as.character(universe))
+        ''', env)
+        SHARED[key] = env
+
+    return SHARED[key]
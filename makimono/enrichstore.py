@@ -0,0 +1,307 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os, sqlite3
+import pandas as pd
+
+import toolbox
+
+"""
+Consolidated (SQLite) store of GO/KEGG enrichment results, replacing the one
+tsv file per set per ontology layout for large runs.
+"""
+
+# ===============================================================================
+
+# store column -> (GO result column, KEGG result column)
+COLUMNS = [("term_id", "GO.ID", "KEGGID"),
+           ("term", "Term", "Term"),
+           ("annotated", "Annotated", "Size"),
+           ("significant", "Significant", "Count"),
+           ("expected", "Expected", "ExpCount"),
+           ("rank", "Rank in classicFisher", None),
+           ("classic", "classicFisher", "Pvalue"),
+           ("elim", "elimFisher", None),
+           ("oddsratio", None, "OddsRatio")]
+
+# column orders of the original result files
+GO_COLUMNS = ["GO.ID", "Term", "Annotated", "Significant", "Expected",
+              "Rank in classicFisher", "classicFisher", "elimFisher"]
+KEGG_COLUMNS = ["KEGGID", "Pvalue", "OddsRatio", "ExpCount", "Count", "Size", "Term"]
+
+ONTOLOGIES = {'bp': "BP", 'mf': "MF", 'cc': "CC", 'kegg': "KEGG"}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS enrichment (
+    directory TEXT NOT NULL,
+    "set" TEXT NOT NULL,
+    ontology TEXT NOT NULL,
+    position INTEGER,
+    term_id TEXT,
+    term TEXT,
+    annotated INTEGER,
+    significant INTEGER,
+    expected NUMERIC,
+    rank INTEGER,
+    classic NUMERIC,
+    elim NUMERIC,
+    oddsratio NUMERIC
+);
+CREATE INDEX IF NOT EXISTS enrichment_set ON enrichment (directory, "set", ontology);
+CREATE INDEX IF NOT EXISTS enrichment_term ON enrichment (term_id);
+CREATE TABLE IF NOT EXISTS imported (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    "set" TEXT NOT NULL,
+    ontology TEXT NOT NULL,
+    mtime REAL,
+    size INTEGER
+);
+CREATE INDEX IF NOT EXISTS imported_set ON imported (directory, "set");
+'''
+
+
+class EnrichmentStore(object):
+
+    """
+    Single-file store of every *_enrichment.tsv found under the goenrich/BP|MF|CC
+    and keggenrich sub-folders of one or more sets folders: one row per (sets
+    folder, set, ontology, term), indexed by set and by term. P-values used for filtering are the
+    elimFisher ones for GO and the (hypergeometric) Pvalue ones for KEGG. The
+    imported files are recorded (with their size and mtime), so that the store
+    can be kept in sync with the folder (see import_tree).
+    """
+
+    def __init__(self, dbpath):
+        self.dbpath = dbpath
+        self._conn = None
+        self._pid = None
+
+
+    def connection(self):
+
+        # connections are never shared with forked (worker) processes
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.dbpath)
+            upgrade(self._conn)
+            self._conn.executescript(SCHEMA)
+            self._pid = os.getpid()
+
+        return self._conn
+
+
+    def import_tree(self, directory):
+
+        """
+        Brings the store in sync with the enrichment result files under a sets
+        folder: files that are new or changed (size/mtime) since they were last
+        imported replace the rows of their set and ontology, and the rows of
+        files that are gone (or can no longer be read) are deleted. Returns the
+        number of files imported.
+        """
+
+        directory = os.path.abspath(directory)
+        index = toolbox.EnrichmentIndex(directory)
+        conn = self.connection()
+        imported = 0
+
+        known = dict((row[0], row[1:]) for row in conn.execute(
+                        'SELECT path, "set", ontology, mtime, size FROM imported WHERE directory = ?',
+                        (directory,)))
+        found = set()
+
+        with conn:
+            for basename, paths in sorted(index.files.items()):
+                for key, folder, ont in toolbox.ENRICHMENT_FOLDERS:
+                    if key not in paths:
+                        continue
+
+                    path = paths[key]
+                    st = os.stat(path)
+
+                    if path in known and tuple(known[path][2:]) == (st.st_mtime, st.st_size):
+                        found.add(path)
+                        continue
+
+                    try:
+                        df = toolbox.read_tsv(path, ont)
+                    except (IOError, OSError, ValueError) as e:
+                        print "Could not import %s (%s)" % (path, e)
+                        continue
+
+                    found.add(path)
+                    forget(conn, path, directory, basename, ONTOLOGIES[key])
+                    conn.executemany('INSERT INTO enrichment VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)',
+                                     to_rows(directory, basename, ONTOLOGIES[key], df))
+                    conn.execute('INSERT INTO imported VALUES (?,?,?,?,?,?)',
+                                 (path, directory, basename, ONTOLOGIES[key], st.st_mtime, st.st_size))
+                    imported += 1
+
+            for path, (basename, ontology, mtime, size) in known.items():
+                if path not in found:
+                    forget(conn, path, directory, basename, ontology)
+
+        return imported
+
+
+    def select(self, where):
+
+        columns = ", ".join('"%s"' % c for c in ["directory", "set", "ontology"] + [c[0] for c in COLUMNS])
+
+        return ('SELECT %s FROM enrichment WHERE %s ORDER BY directory, "set", ontology, position'
+                % (columns, where))
+
+
+    def query(self, where, params):
+
+        return pd.read_sql_query(self.select(where), self.connection(), params=params)
+
+
+    def significant_terms(self, basename, alpha, ontology=None, directory=None):
+
+        """
+        Terms enriched (elimFisher for GO, Pvalue for KEGG, below alpha) for a set,
+        optionally restricted to one ontology ("BP", "MF", "CC" or "KEGG") and to
+        one sets folder.
+        """
+
+        where = '"set" = ? AND COALESCE(elim, classic) < ?'
+        params = [basename, alpha]
+
+        if ontology is not None:
+            where += ' AND ontology = ?'
+            params.append(ontology)
+
+        return self.query(*in_directory(where, params, directory))
+
+
+    def sets_enriched_for(self, term_id, alpha, directory=None):
+
+        """
+        All the sets (sets folders and ontologies) in which a GO term / KEGG
+        pathway is enriched below alpha, optionally in one sets folder only.
+        """
+
+        return self.query(*in_directory('term_id = ? AND COALESCE(elim, classic) < ?', [term_id, alpha],
+                                        directory))
+
+
+    def frames(self, directory, basename, alpha):
+
+        """
+        Returns the enrichment results of a set (of the sets folder 'directory')
+        in the same shape as toolbox.process_enrichment_values (dataframes with
+        the original result file columns, empty for a result file without any
+        rows, None where there is no result file), with a single indexed lookup.
+        """
+
+        conn = self.connection()
+        key = (os.path.abspath(directory), basename)
+
+        records = dict((row[0], []) for row in
+                       conn.execute('SELECT ontology FROM imported WHERE directory = ? AND "set" = ?', key))
+        for row in conn.execute(self.select('directory = ? AND "set" = ?'), key):
+            records.setdefault(row[2], []).append(row[3:])
+
+        extra = {'alpha': alpha}
+
+        for key, ontology in ONTOLOGIES.items():
+            if ontology not in records:
+                extra[key] = None
+            else:
+                extra[key] = from_rows(records[ontology], key == 'kegg')
+
+        return extra
+
+
+# accessory helpers
+# -------------------------------------------------------------------------
+
+def upgrade(conn):
+
+    """
+    Drops the tables of a store written before the rows were keyed by sets
+    folder; they are rebuilt from the result files by the next import_tree.
+    """
+
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(enrichment)')]
+
+    if columns and "directory" not in columns:
+        conn.executescript('DROP TABLE enrichment; DROP TABLE IF EXISTS imported;')
+
+
+
+def in_directory(where, params, directory):
+
+    # restricts a query to the rows of one sets folder (None: all of them)
+    if directory is None:
+        return where, params
+
+    return where + ' AND directory = ?', params + [os.path.abspath(directory)]
+
+
+
+def forget(conn, path, directory, basename, ontology):
+
+    """
+    Deletes the rows and the import record of a result file.
+    """
+
+    conn.execute('DELETE FROM enrichment WHERE directory = ? AND "set" = ? AND ontology = ?',
+                 (directory, basename, ontology))
+    conn.execute('DELETE FROM imported WHERE path = ?', (path,))
+
+
+
+def to_rows(directory, basename, ontology, df):
+
+    """
+    Converts a result file dataframe into store rows.
+    """
+
+    kegg = ontology == "KEGG"
+    rows = []
+
+    for position, record in enumerate(df.to_dict('records')):
+        row = [directory, basename, ontology, position]
+        for column, gocolumn, keggcolumn in COLUMNS:
+            source = keggcolumn if kegg else gocolumn
+            value = record.get(source) if source is not None else None
+            if isinstance(value, basestring) and column in ("classic", "elim", "expected", "oddsratio"):
+                value = to_float(value)
+            elif hasattr(value, "item"):
+                value = value.item()    # numpy scalars -> python (for sqlite3)
+            row.append(value)
+        rows.append(row)
+
+    return rows
+
+
+
+def from_rows(rows, kegg):
+
+    """
+    Converts store rows (without the directory, set and ontology columns) back
+    into a dataframe with the result file columns.
+    """
+
+    if kegg:
+        names = dict((c[0], c[2]) for c in COLUMNS if c[2] is not None)
+        order = KEGG_COLUMNS
+    else:
+        names = dict((c[0], c[1]) for c in COLUMNS if c[1] is not None)
+        order = GO_COLUMNS
+
+    df = pd.DataFrame.from_records(rows, columns=[c[0] for c in COLUMNS])
+
+    return df.rename(columns=names)[order]
+
+
+
+def to_float(value):
+
+    # topGO reports very small p-values as "< 1e-30"
+    try:
+        return float(value.replace("<", "").strip())
+    except (TypeError, ValueError):
+        return None
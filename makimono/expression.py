@@ -0,0 +1,144 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+"""
+NumPy-backed container for (replicate-averaged) RNA-Seq expression values.
+"""
+
+# ========================================================================================
+
+class ExpressionMatrix(object):
+
+    """
+    Expression values stored as a 2D float array (one row per gene/transcript,
+    one column per time point) plus an identifier -> row index. Behaves like the
+    old dictionary of lists (data[identifier], keys(), len(), 'in', ...) so the
+    plotters can keep consuming it unchanged.
+    """
+
+    def __init__(self, ids, matrix):
+        self.ids = list(ids)
+        self.matrix = np.asarray(matrix, dtype=np.float64)
+        self.index = dict((k, i) for i, k in enumerate(self.ids))
+
+        if self.matrix.ndim != 2 or self.matrix.shape[0] != len(self.ids):
+            raise ValueError("Expression matrix shape %s does not match %d identifiers!"
+                             % (self.matrix.shape, len(self.ids)))
+
+
+    # dict-like access
+    # ------------------------------------------------------------------------------------
+    def __getitem__(self, key):
+        return self.matrix[self.index[key]]
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def keys(self):
+        return list(self.ids)
+
+    def items(self):
+        return zip(self.ids, self.matrix)
+
+    def get(self, key, default=None):
+        if key in self.index:
+            return self[key]
+        return default
+
+    # ------------------------------------------------------------------------------------
+
+    def rows(self, keys):
+
+        """
+        Returns the array of row indices for the supplied identifiers
+        (raises KeyError for identifiers that are not in the matrix).
+        """
+
+        return np.array([self.index[k] for k in keys], dtype=np.intp)
+
+
+    def subset(self, keys):
+
+        """
+        Extracts the expression values of a set of genes/transcripts into a new
+        ExpressionMatrix (a single fancy-indexing operation on the value array).
+        """
+
+        keys = list(keys)
+        return ExpressionMatrix(keys, self.matrix[self.rows(keys)])
+
+
+    def apply(self, func):
+
+        """
+        Returns a new ExpressionMatrix with 'func' (a vectorized function,
+        e.g. numpy.log) applied to the whole value array.
+        """
+
+        return ExpressionMatrix(self.ids, func(self.matrix))
+
+# ========================================================================================
+
+def reduce_replicates(block, reps):
+
+    """
+    Conflates the replicates of each time point (columns laid out as
+    A1 ... An ... Z1 ... Zn) into their average, in one vectorized pass.
+    """
+
+    if block.shape[1] % reps != 0:
+        raise ValueError("%d expression columns cannot be split into groups of %d replicates!"
+                         % (block.shape[1], reps))
+
+    return block.reshape(block.shape[0], -1, reps).mean(axis=2)
+
+# ========================================================================================
+
+def parse_expression_lines(lines, reps, pseudocount=1, keep=None, chunksize=4096):
+
+    """
+    Parses tab-separated expression lines (ID A1 ... An ... Z1 ... Zn) into an
+    ExpressionMatrix. Lines are converted and replicate-averaged in chunks, so
+    only the reduced values are kept in memory. If 'keep' (a set of identifiers)
+    is supplied, every other line is skipped before being split or converted.
+    """
+
+    ids = []
+    blocks = []
+    chunk = []
+
+    for line in lines:
+        if keep is not None and line[:line.find("\t")] not in keep:
+            continue
+
+        token = line.rstrip("\r\n").split("\t")
+        if len(token) < 2:
+            continue
+
+        ids.append(token[0])
+        chunk.append(token[1:])
+
+        if len(chunk) == chunksize:
+            blocks.append(reduce_replicates(np.array(chunk, dtype=np.float64), reps))
+            chunk = []
+
+    if len(chunk) > 0:
+        blocks.append(reduce_replicates(np.array(chunk, dtype=np.float64), reps))
+
+    if len(blocks) > 0:
+        matrix = np.concatenate(blocks)
+    else:
+        matrix = np.empty((0, 0), dtype=np.float64)
+
+    if pseudocount:
+        matrix += pseudocount
+
+    return ExpressionMatrix(ids, matrix)
@@ -0,0 +1,168 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os, json, hashlib
+
+import toolbox
+from cache import file_digest, atomic_write
+
+"""
+Build manifest of incremental makisu runs: which inputs every output was built
+from, so that only the outputs whose inputs changed are rebuilt.
+"""
+
+# ========================================================================================
+
+MANIFEST = ".makisu-manifest.json"
+
+class BuildManifest(object):
+
+    """
+    Per output folder record (<outputfolder>/.makisu-manifest.json) of the set
+    files rendered into it: for every set file (by absolute path, so that runs
+    from different input folders into the same output folder are told apart),
+    a key hashing the contents of all its inputs plus the run parameters, and
+    the output files it produced. File hashes are remembered along with the
+    files' size and mtime and only recomputed when those change, so checking an
+    unchanged tree costs one stat per input.
+    """
+
+    def __init__(self, outputfolder):
+
+        self.path = os.path.join(outputfolder, MANIFEST)
+        self.outputfolder = outputfolder
+
+        try:
+            with open(self.path) as fh:
+                content = json.load(fh)
+        except (IOError, ValueError):
+            content = {}
+
+        self.entries = content.get("outputs", {})
+        self.files = content.get("files", {})
+        self.used = set()
+
+
+    def digest(self, path):
+
+        """
+        Content hash of an input file (None if it does not exist).
+        """
+
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+
+        path = os.path.abspath(path)
+        self.used.add(path)
+        known = self.files.get(path)
+
+        if known is None or known[0] != st.st_size or known[1] != st.st_mtime:
+            known = [st.st_size, st.st_mtime, file_digest(path)]
+            self.files[path] = known
+
+        return known[2]
+
+
+    def key(self, inputs, params):
+
+        """
+        Build key of an output: 'inputs' are the paths of the files it is built
+        from (missing files count as inputs too), 'params' any JSON-serializable
+        run parameters.
+        """
+
+        content = {"inputs": dict((os.path.abspath(p), self.digest(p)) for p in inputs),
+                   "params": params}
+
+        return hashlib.sha1(json.dumps(content, sort_keys=True)).hexdigest()
+
+
+    def is_current(self, setfile, key):
+
+        """
+        Whether the outputs of a set file were built from the same inputs and
+        are all still in place.
+        """
+
+        entry = self.entries.get(os.path.abspath(setfile))
+        if entry is None or entry["key"] != key:
+            return False
+
+        return all(os.path.isfile(os.path.join(self.outputfolder, o)) for o in entry["outputs"])
+
+
+    def record(self, setfile, key, outputs):
+
+        """
+        Records the outputs of a set file; other set files (e.g. a same-named one
+        from another input folder) whose outputs these replaced are forgotten.
+        """
+
+        setfile = os.path.abspath(setfile)
+
+        for other, entry in self.entries.items():
+            if other != setfile and set(entry["outputs"]) & set(outputs):
+                del self.entries[other]
+
+        self.entries[setfile] = {"key": key, "outputs": outputs}
+
+
+    def forget(self, setfile):
+        self.entries.pop(os.path.abspath(setfile), None)
+
+
+    def orphans(self, directory, setfiles):
+
+        """
+        Set files of an input folder recorded in the manifest that are no longer
+        among its 'setfiles' (the ones of other input folders are left alone).
+        """
+
+        directory = os.path.abspath(directory)
+        current = set(os.path.join(directory, f) for f in setfiles)
+
+        return sorted(s for s in self.entries if os.path.dirname(s) == directory and s not in current)
+
+
+    def remove(self, setfile):
+
+        """
+        Deletes the outputs of a set file and forgets about it.
+        """
+
+        setfile = os.path.abspath(setfile)
+
+        for o in self.entries[setfile]["outputs"]:
+            try:
+                os.remove(os.path.join(self.outputfolder, o))
+            except OSError:
+                pass
+
+        self.forget(setfile)
+
+
+    def save(self):
+
+        # hashes of files that were not inputs of this run are not kept around
+        files = dict((p, v) for p, v in self.files.items() if p in self.used)
+        content = {"outputs": self.entries, "files": files}
+        atomic_write(self.path, lambda fh: json.dump(content, fh, indent=1, sort_keys=True), mode="w")
+
+# ========================================================================================
+
+def set_inputs(directory, f):
+
+    """
+    Input files of a set file's outputs: the set file itself and the four
+    enrichment result files process_enrichment_values looks up for it.
+    """
+
+    basename = os.path.splitext(f)[0]
+    inputs = [os.path.join(directory, f)]
+
+    for key, folder, ont in toolbox.ENRICHMENT_FOLDERS:
+        inputs.append(os.path.join(directory, folder, basename + "_enrichment.tsv"))
+
+    return inputs
@@ -0,0 +1,589 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import numpy as np
+from scipy import sparse
+from scipy.stats import hypergeom
+
+"""
+Native (NumPy/SciPy) over-representation engines. These produce the same
+<basename>_enrichment.tsv result files as the R based classes in 'enricher',
+without going through rpy2/R.
+"""
+
+# ===============================================================================
+
+class NativeKEGGer(object):
+
+    """
+    KEGG pathway over-representation (hypergeometric test, as in GOstats'
+    hyperGTest) for sets of genes/transcripts of interest. The pathway x gene
+    incidence matrix is built once, from the same two-column (path_id, gene_id)
+    mapping file used by enricher.KEGGer, and then reused for every set.
+    """
+
+    def __init__(self, keggmap, alpha, pathnames=None):
+
+        self.mappings = keggmap
+        self.alpha = alpha
+
+        pairs = read_two_columns(keggmap)
+
+        self.universe = sorted(set(g for p, g in pairs))
+        self.pathways = sorted(set(p for p, g in pairs))
+        self.gene_index = dict((g, i) for i, g in enumerate(self.universe))
+        path_index = dict((p, i) for i, p in enumerate(self.pathways))
+
+        incidence = sparse.coo_matrix(
+                        (np.ones(len(pairs)),
+                         ([path_index[p] for p, g in pairs], [self.gene_index[g] for p, g in pairs])),
+                        shape=(len(self.pathways), len(self.universe))).tocsr()
+        incidence.data[:] = 1    # collapses duplicated mapping lines
+
+        self.incidence = incidence
+        self.sizes = np.asarray(incidence.sum(axis=1)).ravel()
+
+        # Pathway names are optional (KEGG.db is not used here)
+        if pathnames is not None:
+            self.names = dict(read_two_columns(pathnames))
+        else:
+            self.names = {}
+
+
+    def membership(self, genesets):
+
+        """
+        Builds the sets x universe (sparse) membership matrix of a list of
+        gene sets; identifiers outside of the universe are ignored.
+        """
+
+        rows, cols = [], []
+        for r, genes in enumerate(genesets):
+            idx = set(self.gene_index[g] for g in genes if g in self.gene_index)
+            rows.extend([r] * len(idx))
+            cols.extend(idx)
+
+        return sparse.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                                 shape=(len(genesets), len(self.universe)))
+
+
+    def test_sets(self, genesets):
+
+        """
+        Tests a list of gene sets in a single batched pass. Returns, for each set,
+        a list of (KEGGID, Pvalue, OddsRatio, ExpCount, Count, Size, Term) rows
+        with Pvalue < alpha sorted by Pvalue, or None if none of its members are
+        mapped to any pathway.
+        """
+
+        members = self.membership(genesets)
+
+        drawn = np.asarray(members.sum(axis=1)).ravel()                 # N (per set)
+        counts = np.asarray((members * self.incidence.T).todense())    # k (sets x pathways)
+        total = len(self.universe)                                      # M
+        sizes = self.sizes[np.newaxis, :]                               # n (per pathway)
+        N = drawn[:, np.newaxis]
+
+        pvalues = hypergeom.sf(counts - 1, total, sizes, N)
+        expected = sizes * N / float(total)
+
+        # (x/0 gives Inf; an undefined 0/0 stays NaN, written as NA)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            odds = (counts * (total - sizes - N + counts)) / ((sizes - counts) * (N - counts))
+
+        results = []
+        for s in range(len(genesets)):
+
+            if drawn[s] == 0:
+                results.append(None)
+                continue
+
+            hits = np.where((pvalues[s] < self.alpha) & (counts[s] > 0))[0]
+            hits = hits[np.argsort(pvalues[s][hits], kind="mergesort")]
+
+            results.append([(self.pathways[p], pvalues[s, p], odds[s, p], expected[s, p],
+                             int(counts[s, p]), int(self.sizes[p]), self.names.get(self.pathways[p], "NA"))
+                            for p in hits])
+
+        return results
+
+
+    def perform_kegg_enrichment(self, targetspath):
+
+        """
+        Calculates KEGG pathway enrichment for a suplied list of genes/transcripts
+        of interest, saving results to file.
+        """
+
+        self.enrich_many([targetspath])
+
+
+    def enrich_many(self, targetpaths):
+
+        """
+        Calculates KEGG pathway enrichment for several files with lists of
+        genes/transcripts of interest in one batched pass, saving each result
+        to keggenrich/<basename>_enrichment.tsv (next to the list file).
+        """
+
+        genesets = [read_target_group(t) for t in targetpaths]
+
+        for targetspath, rows in zip(targetpaths, self.test_sets(genesets)):
+
+            basename, outname = result_path(targetspath, "keggenrich/")
+
+            if rows is None:
+                print "%s failed to have any KEGG pathways mapped to its members!" % basename
+                continue
+
+            write_table(outname, ["KEGGID", "Pvalue", "OddsRatio", "ExpCount", "Count", "Size", "Term"],
+                        rows)
+
+
+# ===============================================================================
+
+class NativeGOrich(object):
+
+    """
+    GO term enrichment for sets of genes/transcripts of interest, with topGO's
+    "classic" and "elim" Fisher tests. The gene -> GO annotations are propagated
+    up the GO DAG (through precomputed ancestor sets) once per ontology, so any
+    number of sets is then tested against the same annotation matrix.
+    'dag' is a GODag (see read_obo) and 'gomap' either a gene2GO mapping file in
+    topGO's readMappings format or the dictionary returned by read_gene2go, which
+    allows the three ontologies to share the same DAG and mappings.
+    """
+
+    # NOTE: as in GOrich, alpha is not used to filter results -- the topNodes
+    #       best (elimFisher) terms are written, just like topGO's GenTable.
+    def __init__(self, gomap, ontology, alpha, dag, topnodes=30, cutoff=0.01):
+
+        self.mappings = gomap
+        self.ontology = ontology
+        self.alpha = alpha
+        self.dag = dag
+        self.topnodes = topnodes
+        self.cutoff = cutoff
+
+        if isinstance(gomap, dict):
+            gene2go = gomap
+        else:
+            gene2go = read_gene2go(gomap)
+
+        # propagate every gene's annotations (in this ontology) up the DAG
+        annotated = {}
+        for gene, goids in gene2go.items():
+            terms = set()
+            for goid in goids:
+                goid = dag.alt_ids.get(goid, goid)
+                if goid in dag.names and dag.namespace[goid] == ontology:
+                    terms.update(a for a in dag.ancestors(goid) if dag.namespace.get(a) == ontology)
+            if len(terms) > 0:
+                annotated[gene] = terms
+
+        # "feasible" genes: the ones annotated in this ontology
+        self.universe = sorted(annotated)
+        self.gene_index = dict((g, i) for i, g in enumerate(self.universe))
+
+        # terms ordered deepest level first, so that the elim algorithm
+        # always processes children before their parents
+        terms = set()
+        for t in annotated.values():
+            terms.update(t)
+        self.terms = sorted(terms, key=lambda t: (-dag.level(t), t))
+        self.term_index = dict((t, i) for i, t in enumerate(self.terms))
+        self.levels = np.array([dag.level(t) for t in self.terms])
+
+        rows, cols = [], []
+        for gene, ts in annotated.items():
+            for t in ts:
+                rows.append(self.term_index[t])
+                cols.append(self.gene_index[gene])
+
+        self.incidence = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                                           shape=(len(self.terms), len(self.universe)))
+        self.sizes = np.asarray(self.incidence.sum(axis=1)).ravel()
+
+        # terms x terms matrix of strict ancestors (row: ancestor, column: term)
+        # and the (contiguous) range of terms of each level, deepest first, for
+        # the elim removals
+        rows, cols = [], []
+        for i, t in enumerate(self.terms):
+            for a in dag.ancestors(t):
+                if a != t and a in self.term_index:
+                    rows.append(self.term_index[a])
+                    cols.append(i)
+
+        self.ancestry = sparse.csc_matrix((np.ones(len(rows)), (rows, cols)),
+                                          shape=(len(self.terms), len(self.terms)))
+        bounds = np.flatnonzero(np.diff(self.levels)) + 1
+        self.level_ranges = [slice(start, stop) for start, stop in
+                             zip(np.r_[0, bounds], np.r_[bounds, len(self.terms)])]
+
+
+    def membership(self, genesets):
+
+        """
+        Builds the universe x sets boolean matrix of "interesting" genes.
+        """
+
+        interesting = np.zeros((len(self.universe), len(genesets)), dtype=bool)
+        for s, genes in enumerate(genesets):
+            idx = [self.gene_index[g] for g in genes if g in self.gene_index]
+            interesting[idx, s] = True
+
+        return interesting
+
+
+    def test_sets(self, genesets):
+
+        """
+        Runs the classic and elim Fisher tests for a list of gene sets. The
+        classic test is computed for all sets in one batched pass. Returns, for
+        each set, a (classic p-values, elim p-values, significant counts, number
+        of significant genes) tuple -- the arrays over self.terms -- or None if
+        none of its members is annotated.
+        """
+
+        interesting = self.membership(genesets)
+
+        total = len(self.universe)
+        sigtotal = interesting.sum(axis=0)
+        sigcounts = np.asarray(self.incidence * interesting.astype(float))
+
+        classic = hypergeom.sf(sigcounts - 1, total, self.sizes[:, np.newaxis], sigtotal[np.newaxis, :])
+
+        results = []
+        for s in range(len(genesets)):
+
+            if sigtotal[s] == 0:
+                results.append(None)
+                continue
+
+            elim = self.elim_test(interesting[:, s], classic[:, s], sigcounts[:, s])
+            results.append((classic[:, s], elim, sigcounts[:, s], sigtotal[s]))
+
+        return results
+
+
+    def elim_test(self, interesting, classic, sigcounts):
+
+        """
+        topGO's "elim" algorithm: levels are processed bottom-up and the genes of
+        every term significant at 'cutoff' are removed from all its ancestors
+        before these are tested. As in topGO, the universe (and its number of
+        significant genes) stays the same, only the terms lose genes. Terms with
+        no removed genes keep their classic p-value; the counts of the others
+        are built once per level, from a sparse terms x universe matrix of the
+        genes removed so far.
+        """
+
+        total = len(interesting)
+        sigtotal = interesting.sum()
+        weights = interesting.astype(float)
+
+        elim = classic.copy()
+        removed = sparse.csr_matrix((len(self.terms), total))
+
+        for members in self.level_ranges:
+
+            if removed.nnz > 0:
+                dropped = removed[members]
+                dropped.data[:] = 1    # (a gene removed by several descendants counts once)
+
+                lost = np.asarray(dropped.sum(axis=1)).ravel()
+                retest = lost > 0
+
+                if retest.any():
+                    sizes = self.sizes[members][retest] - lost[retest]
+                    counts = sigcounts[members][retest] - dropped.dot(weights)[retest]
+                    elim[np.arange(members.start, members.stop)[retest]] = \
+                        hypergeom.sf(counts - 1, total, sizes, sigtotal)
+
+            significant = members.start + np.flatnonzero(elim[members] < self.cutoff)
+            if len(significant) > 0:
+                removed = removed + (self.ancestry[:, significant] * self.incidence[significant]).tocsr()
+
+        return elim
+
+
+    def gen_table(self, classic, elim, sigcounts, sigtotal):
+
+        """
+        Builds topGO's GenTable rows (ordered by elimFisher, ranks of classicFisher,
+        topNodes rows) for one tested set.
+        """
+
+        total = len(self.universe)
+
+        ranks = np.empty(len(classic), dtype=int)
+        ranks[np.lexsort((np.arange(len(classic)), classic))] = np.arange(1, len(classic)+1)
+
+        order = np.lexsort((classic, elim))[:self.topnodes]
+
+        rows = []
+        for t in order:
+            term = self.dag.names[self.terms[t]]
+            if len(term) > 40:
+                term = term[:40] + "..."
+            rows.append((self.terms[t], term, int(self.sizes[t]), int(sigcounts[t]),
+                         "%.2f" % (self.sizes[t] * sigtotal / float(total)), ranks[t],
+                         format_pvalue(classic[t]), format_pvalue(elim[t])))
+
+        return rows
+
+
+    def perform_go_enrichment(self, targetspath):
+
+        """
+        Calculates GO term enrichment in a suplied list of genes/transcripts of
+        interest, saving results to file.
+        """
+
+        self.enrich_many([targetspath])
+
+
+    def enrich_many(self, targetpaths):
+
+        """
+        Calculates GO term enrichment for several files with lists of
+        genes/transcripts of interest, saving each result to
+        goenrich/<ontology>/<basename>_enrichment.tsv (next to the list file).
+        """
+
+        genesets = [read_target_group(t) for t in targetpaths]
+
+        for targetspath, result in zip(targetpaths, self.test_sets(genesets)):
+
+            basename, outname = result_path(targetspath, "goenrich/"+self.ontology)
+
+            if result is None:
+                print "%s failed to have any GO %s terms mapped to its members!" % (basename, self.ontology)
+                continue
+
+            write_table(outname, ["GO.ID", "Term", "Annotated", "Significant", "Expected",
+                                  "Rank in classicFisher", "classicFisher", "elimFisher"],
+                        self.gen_table(*result))
+
+# ===============================================================================
+
+NAMESPACES = {"biological_process": "BP", "molecular_function": "MF",
+              "cellular_component": "CC"}
+
+
+class GODag(object):
+
+    """
+    The GO graph (is_a and part_of relations) read from an OBO file, with the
+    ancestors and level (longest path from the root) of each term memoized.
+    """
+
+    def __init__(self, names, namespace, parents, alt_ids):
+        self.names = names
+        self.namespace = namespace
+        self.parents = parents
+        self.alt_ids = alt_ids
+        self._ancestors = {}
+        self._levels = {}
+
+
+    def ancestors(self, goid):
+
+        """
+        Returns the frozenset of a term and all its ancestors.
+        """
+
+        if goid not in self._ancestors:
+            result = set([goid])
+            for p in self.parents.get(goid, ()):
+                result.update(self.ancestors(p))
+            self._ancestors[goid] = frozenset(result)
+
+        return self._ancestors[goid]
+
+
+    def level(self, goid):
+
+        if goid not in self._levels:
+            parents = self.parents.get(goid, ())
+            if len(parents) == 0:
+                self._levels[goid] = 1
+            else:
+                self._levels[goid] = 1 + max(self.level(p) for p in parents)
+
+        return self._levels[goid]
+
+
+
+def read_obo(obofile):
+
+    """
+    Parses the [Term] stanzas of a GO OBO file (e.g. go-basic.obo) into a GODag;
+    obsolete terms are skipped.
+    """
+
+    names, namespace, parents, alt_ids = {}, {}, {}, {}
+
+    def add(term):
+        if term.get("id") and not term.get("obsolete"):
+            names[term["id"]] = term.get("name", "")
+            namespace[term["id"]] = NAMESPACES.get(term.get("namespace"))
+            parents[term["id"]] = term.get("parents", [])
+            for alt in term.get("alt_ids", []):
+                alt_ids[alt] = term["id"]
+
+    term = None
+    with open(obofile) as fh:
+        for line in fh:
+            line = line.strip()
+
+            if line.startswith("["):
+                if term is not None:
+                    add(term)
+                term = {} if line == "[Term]" else None
+                continue
+
+            if term is None or ":" not in line:
+                continue
+
+            tag, value = line.split(":", 1)
+            value = value.split("!")[0].strip()
+
+            if tag == "id":
+                term["id"] = value
+            elif tag == "name":
+                term["name"] = value
+            elif tag == "namespace":
+                term["namespace"] = value
+            elif tag == "is_a":
+                term.setdefault("parents", []).append(value.split()[0])
+            elif tag == "relationship" and value.split()[0] == "part_of":
+                term.setdefault("parents", []).append(value.split()[1])
+            elif tag == "alt_id":
+                term.setdefault("alt_ids", []).append(value)
+            elif tag == "is_obsolete" and value == "true":
+                term["obsolete"] = True
+
+    if term is not None:
+        add(term)
+
+    return GODag(names, namespace, parents, alt_ids)
+
+
+
+def read_gene2go(gomap):
+
+    """
+    Reads a gene2GO mapping file in topGO's readMappings format (gene, then
+    a comma separated list of GO identifiers) into a dictionary.
+    """
+
+    gene2go = {}
+    with open(gomap) as fh:
+        for line in fh:
+            token = line.rstrip("\r\n").split("\t")
+            if len(token) < 2 or token[0].strip() == "":
+                continue
+            gene2go.setdefault(token[0].strip(), []).extend(
+                        x.strip() for x in token[1].split(",") if x.strip() != "")
+
+    return gene2go
+
+# accessory helpers
+# -------------------------------------------------------------------------
+
+def read_two_columns(path):
+
+    """
+    Reads a (header-less) two column tsv file into a list of tuples.
+    """
+
+    pairs = []
+    with open(path) as fh:
+        for line in fh:
+            token = line.rstrip("\r\n").split("\t")
+            if len(token) >= 2 and token[0].strip() != "":
+                pairs.append((token[0].strip(), token[1].strip()))
+
+    return pairs
+
+
+
+def read_target_group(targetspath):
+
+    """
+    Reads a tsv file and returns its first column (while assuming they are
+    transcript/gene identifiers).
+    """
+
+    genes = []
+    with open(targetspath) as fh:
+        for line in fh:
+            token = line.split("\t")
+            genes.append(token[0].strip())
+
+    return genes
+
+
+
+def result_path(targetspath, enrich):
+
+    """
+    Creates folder to save enrichment results (if there is not one
+    already) and returns the set's basename and the full path to the
+    results file to be saved to.
+    """
+
+    basename = os.path.splitext(os.path.basename(targetspath))[0]
+    foldername = os.path.dirname(targetspath)
+
+    outname = os.path.join(foldername, enrich, basename+"_enrichment.tsv")
+
+    # if not exists, create folder to save enrichment results
+    savepath = os.path.join(foldername, enrich)
+    try:
+        os.makedirs(savepath)
+    except OSError:
+        if not os.path.isdir(savepath):
+            raise
+
+    return basename, outname
+
+
+
+def write_table(outname, header, rows):
+
+    """
+    Writes result rows as a tab separated table, formatted as R's write.table
+    (quote = FALSE, row.names = FALSE) would.
+    """
+
+    with open(outname, "w") as fh:
+        fh.write("\t".join(header) + "\n")
+        for row in rows:
+            fh.write("\t".join(format_value(x) for x in row) + "\n")
+
+
+
+def format_value(x):
+
+    if isinstance(x, (float, np.floating)):
+        if np.isinf(x):
+            return "Inf" if x > 0 else "-Inf"
+        if np.isnan(x):
+            return "NA"
+        return "%.15g" % x
+
+    return str(x)
+
+
+
+def format_pvalue(p):
+
+    """
+    Formats p-values as topGO's GenTable does (2 significant digits, with
+    values below 1e-30 reported as 1e-30).
+    """
+
+    return "%.2g" % max(p, 1e-30)
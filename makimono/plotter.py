@@ -2,18 +2,19 @@
 # -*- coding: utf-8 -*-
 
 import toolbox
-import templater
+import density
+import profiling
+from cache import atomic_write
 
-import sys, os, re, codecs, urllib
+import sys, os, re, codecs
 import numpy as np
-import matplotlib.pyplot as plt
 
 from math import pi, log
 from collections import OrderedDict
 
-from bokeh.plotting import figure, ColumnDataSource, save, reset_output
-from bokeh.models import Circle, FixedTicker, HoverTool, OpenURL, TapTool
-from bokeh.embed import components
+# NOTE: matplotlib, bokeh and the templater are imported by the methods that use
+#       them, so that importing this module (and running makisu in a mode that
+#       needs only one of the plotting libraries) does not load them all.
 
 # ===========================================================================================
 
@@ -31,48 +32,160 @@ class Mlplot(object):
 
     # NOTE: cross-SANITIZE lengths of: ticks, timepoints, expression lists (in dicts)
     # and think if its necessary to split "name" into "filename" & "titlename".
-    def plot_mpl_figure(self, subset, name, mode="semilogy", savelocation=os.path.expanduser("~")):
+    def plot_mpl_figure(self, subset, name, mode="semilogy", savelocation=os.path.expanduser("~"),
+                        ylabel=None):
 
         """
         Generates matplotlib static figures from subsets of differential expressed
-        genes/transcripts over a given timecourse experiment. 
+        genes/transcripts over a given timecourse experiment. The y-axis is
+        labelled 'ylabel' (None: after the axis mode).
         """
 
-        plt.clf()
-        plt.title(name)
+        import matplotlib
+        from matplotlib.collections import LineCollection
 
-        if mode == "linear" or mode == "semilogy":
-            plt.xlabel("Time points")
-        else:
-            plt.xlabel("Time points (log)")
+        if mode not in AXIS_SCALES:
+            print "Wrong matplotlib axis-mode selected!"
+            sys.exit()
 
-        if mode == "linear" or mode == "semilogx":
-            plt.ylabel("normalized expression counts")
-        else:
-            plt.ylabel("log"+r'$\mathregular{_{normalized\ expression\ counts}}$')
-  
-
-        plt.xlim(0, self.timepoints[-1])
-        plt.xticks(rotation=65)
-        plt.xticks(self.timepoints, self.ticks)
-
-
-        for gene in subset.keys():
-            if mode == "linear":
-                plt.plot(self.timepoints, subset[gene])
-            elif mode == "loglog":
-                plt.loglog(self.timepoints, subset[gene])
-            elif mode == "semilogx":
-                plt.semilogx(self.timepoints, subset[gene])
-            elif mode == "semilogy":
-                plt.semilogy(self.timepoints, subset[gene])
+        with profiling.stage("plotting"):
+            fig, ax = self.line_axes(mode, ylabel)
+            ax.set_title(name)
+
+            # the whole set is a single collection of (genes x time points) segments
+            values = density.profile_matrix(subset)
+            segments = np.empty(values.shape + (2,))
+            segments[:, :, 0] = self.timepoints
+            segments[:, :, 1] = values
+
+            cycle = matplotlib.rcParams['axes.prop_cycle'].by_key()['color']
+            lines = LineCollection(segments, colors=[cycle[i % len(cycle)] for i in range(len(values))],
+                                   linewidths=matplotlib.rcParams['lines.linewidth'])
+            lines.set_capstyle(matplotlib.rcParams['lines.solid_capstyle'])
+            lines.set_joinstyle(matplotlib.rcParams['lines.solid_joinstyle'])
+
+            # the y range follows the set being drawn (not the previous ones)
+            ax.ignore_existing_data_limits = True
+            ax.add_collection(lines)
+            ax.autoscale_view(scalex=False)
+
+        # (an explicit extension and format: matplotlib would otherwise take the
+        # format from any dot in the set name)
+        try:
+            with profiling.stage("writing"):
+                fig.savefig(os.path.join(savelocation, name + ".png"), format="png")
+        finally:
+            lines.remove()
+
+
+    def line_axes(self, mode, ylabel=None):
+
+        """
+        Returns the (shared, per process) Agg figure and axes used for the line
+        plots of an axis mode, configuring the axes the first time only.
+        """
+
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        key = (mode, ylabel, tuple(self.timepoints), tuple(self.ticks))
+
+        if key not in FIGURES:
+            fig = Figure()
+            FigureCanvasAgg(fig)
+            ax = fig.add_subplot(111)
+
+            xscale, yscale = AXIS_SCALES[mode]
+
+            if xscale == "linear":
+                ax.set_xlabel("Time points")
+            else:
+                ax.set_xlabel("Time points (log)")
+
+            if ylabel is not None:
+                ax.set_ylabel(ylabel)
+            elif yscale == "linear":
+                ax.set_ylabel("normalized expression counts")
             else:
-                print "Wrong matplotlib axis-mode selected!"
-                sys.exit()
+                ax.set_ylabel("log"+r'$\mathregular{_{normalized\ expression\ counts}}$')
 
+            ax.set_yscale(yscale)
 
-        plt.savefig(os.path.join(savelocation, name))
-        
+            ax.set_xlim(0, self.timepoints[-1])
+            ax.set_xticks(self.timepoints)
+            ax.set_xticklabels(self.ticks, rotation=65)
+
+            # (as with pyplot) a log x-axis replaces the time point ticks
+            if xscale != "linear":
+                ax.set_xscale(xscale)
+
+            FIGURES[key] = (fig, ax)
+
+        return FIGURES[key]
+
+
+    def plot_density_figure(self, subset, name, savelocation=os.path.expanduser("~"), highlight=None,
+                            bins=density.DENSITY_BINS, ylabel=None):
+
+        """
+        Generates an aggregate figure for (very) large subsets of (log) expression
+        values: a heatmap of the number of profiles per value bin and time point,
+        the median and the 25-75% and 5-95% percentile bands, and the profiles of
+        the (optional) 'highlight' genes/transcripts drawn individually. The
+        y-axis is labelled 'ylabel' (None: log normalized expression counts).
+        """
+
+        from matplotlib import cm
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        with profiling.stage("plotting"):
+            values = density.profile_matrix(subset)
+            counts, edges = density.profile_density(values, bins)
+
+            fig = Figure()
+            FigureCanvasAgg(fig)
+            ax = fig.add_subplot(111)
+
+            ax.set_title(name)
+            ax.set_xlabel("Time points")
+            if ylabel is not None:
+                ax.set_ylabel(ylabel)
+            else:
+                ax.set_ylabel("log"+r'$\mathregular{_{normalized\ expression\ counts}}$')
+
+            # empty cells are left blank
+            ax.pcolormesh(density.time_edges(self.timepoints), edges,
+                          np.ma.masked_equal(np.log1p(counts), 0), cmap=cm.Blues)
+
+            bands = density.percentile_bands(values)
+            for lower, upper in density.BANDS:
+                ax.fill_between(self.timepoints, bands[lower], bands[upper], color="olive", alpha=0.2,
+                                linewidth=0)
+            ax.plot(self.timepoints, bands[50], color="olive", linewidth=2)
+
+            for gene in highlight or []:
+                if gene in subset:
+                    ax.plot(self.timepoints, subset[gene], label=gene)
+
+            if highlight and any(gene in subset for gene in highlight):
+                ax.legend(loc="best", fontsize="small")
+
+            ax.set_xlim(0, self.timepoints[-1])
+            ax.set_xticks(self.timepoints)
+            ax.set_xticklabels(self.ticks, rotation=65)
+
+        with profiling.stage("writing"):
+            fig.savefig(os.path.join(savelocation, name + ".png"), format="png")
+
+
+# x/y axis scales of the matplotlib plot modes
+AXIS_SCALES = {"linear": ("linear", "linear"), "loglog": ("log", "log"),
+               "semilogx": ("log", "linear"), "semilogy": ("linear", "log")}
+
+# figures reused by every Mlplot of a process (see Mlplot.line_axes); nothing is
+# shared through pyplot, so worker processes never step on each other's plots
+FIGURES = {}
 
 # ===========================================================================================
 
@@ -89,18 +202,103 @@ class Blur(object):
         self.ticks = [float(x) for x in ticks]
 
  
-    def generate_interactive_bokeh_plot(self, subset, name, savelocation, annots=None, plus=None, portability="web"):
+    def generate_interactive_bokeh_plot(self, subset, name, savelocation, annots=None, plus=None, portability="web",
+                                        ylabel="normalized expression counts"):
 
         """
         Generates interactive bokeh plots along with (optional) annotation and enrichment reports.
         """
 
+        with profiling.stage("plotting"):
+            plot = self.new_figure(name, ylabel=ylabel)
+
+            self.add_profiles(plot, subset, annots)
+
+        self.write_page(plot, name, savelocation, annots, plus, portability)
+
+
+
+    def generate_density_bokeh_plot(self, subset, name, savelocation, annots=None, plus=None, 
+                                    portability="web", highlight=None, bins=density.DENSITY_BINS,
+                                    ylabel="log normalized expression counts"):
+
+        """
+        Generates an aggregate bokeh plot for (very) large subsets: the number of
+        profiles per value bin and time point drawn as a heatmap, overlaid with
+        the median and the 25-75% and 5-95% percentile bands. Genes/transcripts
+        listed in 'highlight' are drawn individually on top.
+        """
+
+        from bokeh.plotting import ColumnDataSource
+        from bokeh.models import HoverTool
+        from bokeh.palettes import Blues9
+
+        with profiling.stage("plotting"):
+            plot = self.new_figure(name, ylabel=ylabel)
+
+            values = density.profile_matrix(subset)
+            counts, edges = density.profile_density(values, bins)
+            xedges = density.time_edges(self.timepoints)
+
+            # only the non-empty cells are drawn, coloured by (log) profile count
+            rows, cols = np.nonzero(counts)
+            cellcounts = counts[rows, cols]
+            palette = Blues9[::-1][2:]
+            if len(cellcounts) > 0:
+                shade = np.log1p(cellcounts) / np.log1p(cellcounts.max())
+            else:
+                shade = []
+            colours = [palette[int(round(v * (len(palette) - 1)))] for v in shade]
+
+            cells = ColumnDataSource(
+                data=dict(
+                    left=xedges[cols].tolist(),
+                    right=xedges[cols + 1].tolist(),
+                    bottom=edges[rows].tolist(),
+                    top=edges[rows + 1].tolist(),
+                    count=cellcounts.tolist(),
+                    color=colours
+                )
+            )
+
+            cell_renderer = plot.quad(left="left", right="right", bottom="bottom", top="top", source=cells,
+                                      fill_color="color", line_color=None)
+
+            plot.add_tools( HoverTool(tooltips="@count profiles", renderers=[cell_renderer]))
+
+            # PERCENTILE BANDS
+            bands = density.percentile_bands(values)
+            for lower, upper in density.BANDS:
+                plot.patch(self.timepoints + self.timepoints[::-1],
+                           bands[lower].tolist() + bands[upper][::-1].tolist(),
+                           color="olive", alpha=0.15, line_color=None)
+            plot.line(self.timepoints, bands[50].tolist(), color="olive", line_width=3)
+
+            # HIGHLIGHTS
+            if highlight:
+                chosen = OrderedDict((gene, subset[gene]) for gene in highlight if gene in subset)
+                if len(chosen) > 0:
+                    self.add_profiles(plot, chosen, annots)
+
+        self.write_page(plot, name, savelocation, annots, plus, portability)
+
+
+
+    def new_figure(self, name, ylabel="normalized expression counts"):
+
+        """
+        Creates an (empty) bokeh figure with the common plot configuration.
+        """
+
+        from bokeh.plotting import figure
+        from bokeh.models import FixedTicker
+
         # PLOT CONFIG (NOTE: maybe expose (init) some of the configs later? ex. axis labels, sizes, etc.)
         # ----------------------------------------------------------------------------------------------------------
         TOOLS = "pan,wheel_zoom,box_zoom,reset,save,box_select,resize"
 
         plot = figure(tools=TOOLS, x_axis_label="Time points (h)", 
-                                   y_axis_label="normalized expression counts")
+                                   y_axis_label=ylabel)
 
         plot.plot_width = 800
         plot.plot_height = 800
@@ -117,69 +315,97 @@ class Blur(object):
         plot.xaxis.bounds = (0, self.timepoints[-1])
 
         plot.xaxis.major_label_orientation = pi/float(2.5)
-        # ----------------------------------------------------------------------------------------------------------
 
-        colour_list = toolbox.get_spaced_colors(len(subset))
-        c = 0
+        return plot
 
-        for gene in subset.keys():
 
-            if annots != None:
-                labelextra = [annots[gene][0].strip() for x_, y_ in zip(self.timepoints, subset[gene])]
-            else:
-                labelextra = ["" for x_, y_ in zip(self.timepoints, subset[gene])]
 
+    def add_profiles(self, plot, subset, annots=None):
 
-            cds = ColumnDataSource(
-                data=dict(
-                    x=self.timepoints,
-                    y=subset[gene],
-                    label=[gene for x_, y_ in zip(self.timepoints, subset[gene])],
-                    labelextra = labelextra
-                )
+        """
+        Draws every profile of a subset as a coloured line, with hoverable data
+        points (identifier and annotation tooltips).
+        """
+
+        from bokeh.plotting import ColumnDataSource
+        from bokeh.models import Circle, HoverTool
+
+        # All genes/transcripts share one source per glyph type (one row per
+        # gene for the lines, one row per data point for the circles), so the
+        # page holds two renderers and a single hover tool however large the
+        # set is.
+        # ----------------------------------------------------------------------------------------------------------
+        genes = list(subset.keys())
+        values = density.profile_matrix(subset, genes)
+        npoints = values.shape[1]
+
+        colour_list = ["#%02x%02x%02x" % rgb for rgb in toolbox.get_spaced_colors(len(genes))][:len(genes)]
+
+        if annots != None:
+            annotations = [annots[gene][0].strip() for gene in genes]
+        else:
+            annotations = ["" for gene in genes]
+
+        # the "annotations:" heading is only shown for annotated genes/transcripts
+        headings = ["annotations:" if a != "" else "" for a in annotations]
+
+        lines = ColumnDataSource(
+            data=dict(
+                xs=[self.timepoints for gene in genes],
+                ys=values.tolist(),
+                color=colour_list
+            )
+        )
+
+        points = ColumnDataSource(
+            data=dict(
+                x=np.tile(self.timepoints, len(genes)).tolist(),
+                y=values.ravel().tolist(),
+                color=np.repeat(colour_list, npoints).tolist(),
+                label=np.repeat(genes, npoints).tolist(),
+                annothead=np.repeat(headings, npoints).tolist(),
+                labelextra=np.repeat(annotations, npoints).tolist()
             )
+        )
 
-            # PLOTARAMA
-            plot.line("x","y", source=cds, color=colour_list[c])
-            circle = Circle(x='x', y='y', line_color=None, fill_color=colour_list[c])
-            c += 1
-            circle_renderer = plot.add_glyph(cds, circle)
+        # PLOTARAMA
+        plot.multi_line("xs", "ys", source=lines, color="color")
+        circle = Circle(x='x', y='y', line_color=None, fill_color="color")
+        circle_renderer = plot.add_glyph(points, circle)
 
 
-            # HOVER control
-            # -----------------------------------------------------------------------------------
-            if annots != None:
+        # HOVER control
+        # -----------------------------------------------------------------------------------
+        tooltips = """
+                    <div style="width:350px">
+                    <b> @label </b><br/>
+                    <i><u>@annothead</u></i><br/> @labelextra
+                    </div>
+        """
 
-                if annots[gene][0].strip() != "": 
+        plot.add_tools( HoverTool(tooltips=tooltips, renderers=[circle_renderer]))
 
-                    tooltips = """
-                                <div style="width:350px">
-                                <b> @label </b><br/>
-                                <i><u>annotations:</u></i><br/> @labelextra    
-                                </div>
-                    """
-                else:
-                    tooltips = """
-                            <div style="width:350px">
-                            <b> @label </b><br/>
-                            </div>
-                    """
 
 
-            else:
-                tooltips = """
-                            <div style="width:350px">
-                            <b> @label </b><br/>
-                            </div>
-                """
+    def write_page(self, plot, name, savelocation, annots=None, plus=None, portability="web"):
 
-            plot.add_tools( HoverTool(tooltips=tooltips, renderers=[circle_renderer]))
+        """
+        Writes a plot (along with the annotation and enrichment reports) as an
+        html page named after 'name'.
+        """
+
+        from bokeh.plotting import reset_output
+        from bokeh.embed import components
+
+        import templater
+        import assets
 
         # ====================================================== #
         #                        TEMPLATING                      #
         # ====================================================== #
 
-        script, div = components(plot)
+        with profiling.stage("templating"):
+            script, div = components(plot)
 
 
         # process "name" here to get "title"
@@ -199,39 +425,26 @@ class Blur(object):
 
 
         # ====================================================
+        # the pages of a "batch" output folder share one local copy of BokehJS
         if portability == "batch":
-            path = os.path.join(savelocation, "static/")
-            try: 
-                os.makedirs(path)
-            except OSError:
-                if not os.path.isdir(path):
-                    raise
-
-            cssfile = urllib.URLopener()
-            cssfile.retrieve("https://cdn.pydata.org/bokeh/release/bokeh-0.11.1.min.css",
-                              os.path.join(path, "bokeh-0.11.1.min.css"))
-            jsfile = urllib.URLopener()
-            jsfile.retrieve("https://cdn.pydata.org/bokeh/release/bokeh-0.11.1.min.js",
-                             os.path.join(path, "bokeh-0.11.1.min.js"))
-
-
-
-        # If a dictionary of enrichment dataframes is
-        # available, pass it along...
-        if plus is not None:
-            html = scaffold.render_main_page(portability, plus)
-        else:
-            html = scaffold.render_main_page(portability)
+            assets.ensure_assets(savelocation)
+
+
 
-    
         # WRITE IT OUT    
         # --------------------------------------------------------------------------
         filename = os.path.join(savelocation, name+".html")
 
         # better to save it with the latin-1 charset because wiggly 
         # characters tend to sneak through annotations and they can be a pain...
-        with codecs.open(filename, encoding='latin-1', mode="w") as f:
-            f.write(html)
+        # If a dictionary of enrichment dataframes is available, pass it along...
+        # (the page is streamed into a temporary file, so that a failure halfway
+        # through, e.g. a UnicodeEncodeError, never leaves a truncated page behind)
+        def writer(f):
+            scaffold.stream_main_page(codecs.getwriter('latin-1')(f), portability, plus)
+
+        with profiling.stage("writing"):
+            atomic_write(filename, writer)
 
         reset_output(plot)    # resets plot data and avoids file balloning when iterating
 
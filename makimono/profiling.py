@@ -0,0 +1,219 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os, json, time, resource
+
+"""
+Optional per-stage instrumentation (wall time, CPU time, RSS). Library code
+wraps its stages in profiling.stage(name); unless a Profiler was enabled, that
+returns a shared do-nothing context manager.
+"""
+
+# ========================================================================================
+
+# the enabled Profiler of this process (None: profiling is off)
+ACTIVE = None
+
+class NullStage(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL = NullStage()
+
+
+def stage(name):
+
+    """
+    Context manager timing a stage (e.g. "expression", "plotting") of the
+    current task, if profiling is enabled.
+    """
+
+    if ACTIVE is None:
+        return NULL
+
+    return Stage(ACTIVE, name)
+
+
+
+def task(name):
+
+    """
+    Context manager marking the stages run inside it as belonging to a task (a
+    set file, in makisu) and timing the task as a whole ("set" stage).
+    """
+
+    if ACTIVE is None:
+        return NULL
+
+    return Task(ACTIVE, name)
+
+
+
+def enable():
+
+    """
+    Turns profiling on for this process and returns the Profiler collecting
+    the records.
+    """
+
+    global ACTIVE
+    ACTIVE = Profiler()
+
+    return ACTIVE
+
+
+
+def disable():
+
+    global ACTIVE
+    ACTIVE = None
+
+# ========================================================================================
+
+def peak_rss():
+
+    # peak resident set size of the process so far, in MB (ru_maxrss is in KB on Linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+
+def current_rss():
+
+    # resident set size of the process right now, in MB (/proc/self/statm counts pages);
+    # without /proc (not Linux) the peak so far is the best there is
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * PAGESIZE / (1024.0 * 1024.0)
+    except (IOError, OSError, ValueError, IndexError):
+        return peak_rss()
+
+PAGESIZE = resource.getpagesize()
+
+
+
+def cpu_time():
+
+    t = os.times()
+    return t[0] + t[1]
+
+
+
+class Stage(object):
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.wall = time.time()
+        self.cpu = cpu_time()
+        self.rss = current_rss()
+        return self
+
+    def __exit__(self, *exc):
+        rss = current_rss()
+        self.profiler.records.append({"stage": self.name, "task": self.profiler.task,
+                                      "pid": os.getpid(), "start": self.wall,
+                                      "wall": time.time() - self.wall, "cpu": cpu_time() - self.cpu,
+                                      "rss": rss, "rss_change": rss - self.rss})
+        return False
+
+
+
+class Task(Stage):
+
+    def __init__(self, profiler, name):
+        Stage.__init__(self, profiler, "set")
+        self.taskname = name
+
+    def __enter__(self):
+        self.previous = self.profiler.task
+        self.profiler.task = self.taskname
+        return Stage.__enter__(self)
+
+    def __exit__(self, *exc):
+        Stage.__exit__(self, *exc)
+        self.profiler.task = self.previous
+        return False
+
+# ========================================================================================
+
+class Profiler(object):
+
+    """
+    Collects one record per stage run: stage and task names, process id, start
+    time, wall and CPU seconds, the process' RSS (MB) at the end of the stage
+    and how much it changed over the stage (what the stage allocated and kept,
+    or freed).
+    """
+
+    def __init__(self):
+        self.records = []
+        self.task = None
+        self.started = time.time()
+
+
+    def summary(self):
+
+        """
+        Returns the summary table (a string): totals per stage, then the slowest
+        tasks. Stage times include those of the stages run inside them (e.g. the
+        "enrichment" files read while "writing" a page). For every stage, the
+        highest RSS at its end and its largest RSS change over one call are
+        shown.
+        """
+
+        stages = {}
+        for r in self.records:
+            s = stages.setdefault(r["stage"], {"count": 0, "wall": 0.0, "cpu": 0.0, "rss": 0.0,
+                                               "change": None})
+            s["count"] += 1
+            s["wall"] += r["wall"]
+            s["cpu"] += r["cpu"]
+            s["rss"] = max(s["rss"], r["rss"])
+            s["change"] = r["rss_change"] if s["change"] is None else max(s["change"], r["rss_change"])
+
+        lines = ["run: %.3f s wall, %.1f MB peak RSS (main process)" % (time.time() - self.started,
+                                                                       peak_rss()), ""]
+        lines.append("%-14s %7s %10s %10s %12s %15s" % ("stage", "calls", "wall (s)", "cpu (s)",
+                                                          "RSS (MB)", "RSS change (MB)"))
+        for name, s in sorted(stages.items(), key=lambda item: -item[1]["wall"]):
+            lines.append("%-14s %7d %10.3f %10.3f %12.1f %+15.1f" % (name, s["count"], s["wall"], s["cpu"],
+                                                                    s["rss"], s["change"]))
+
+        tasks = sorted((r for r in self.records if r["stage"] == "set"), key=lambda r: -r["wall"])
+        if tasks:
+            lines.append("")
+            lines.append("%-40s %10s %10s %12s %15s" % ("slowest sets", "wall (s)", "cpu (s)", "RSS (MB)",
+                                                        "RSS change (MB)"))
+            for r in tasks[:10]:
+                lines.append("%-40s %10.3f %10.3f %12.1f %+15.1f" % (r["task"][:40], r["wall"], r["cpu"],
+                                                                    r["rss"], r["rss_change"]))
+
+        return "\n".join(lines)
+
+
+    def write(self, path, format="json"):
+
+        """
+        Writes the records as JSON, or as a Chrome trace ("chrome"; to be opened
+        with chrome://tracing or Perfetto).
+        """
+
+        if format == "chrome":
+            events = [{"name": r["stage"], "cat": r["task"] or "run", "ph": "X",
+                       "ts": int(r["start"] * 1e6), "dur": int(r["wall"] * 1e6),
+                       "pid": r["pid"], "tid": r["pid"],
+                       "args": {"task": r["task"], "cpu": r["cpu"], "rss": r["rss"],
+                                "rss_change": r["rss_change"]}}
+                      for r in self.records]
+            content = {"traceEvents": events, "displayTimeUnit": "ms"}
+        else:
+            content = {"records": self.records}
+
+        with open(path, "w") as fh:
+            json.dump(content, fh, indent=1)
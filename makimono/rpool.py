@@ -0,0 +1,150 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import sys, signal, traceback
+import multiprocessing
+
+from cache import ResultCache
+
+"""
+Runs the R based enrichments (see 'enricher') concurrently, on a pool of worker
+processes that each embed their own R interpreter.
+
+WARNING: this module must be used from a process that has NOT imported 'enricher'
+         (or rpy2.robjects) itself -- an embedded R does not survive being forked,
+         so R is only ever started inside the workers. EnrichmentExecutor.run
+         refuses to start the workers from a process where R is running.
+"""
+
+# ===============================================================================
+
+class EnrichmentExecutor(object):
+
+    """
+    Dispatches (enrichment, set file) tasks to N worker processes. Every worker
+    starts its own embedded R and builds each requested enrichment object once,
+    so the R packages and mappings are loaded at most once per worker (and only
+    when a set is not found in the cache). Results are streamed back in
+    completion order. If 'cachedir' is given, the workers share an enrichment
+    result cache (cache.ResultCache), whose hits and misses are returned with
+    every result and added up in the executor (see stats).
+    """
+
+    def __init__(self, jobs, cachedir=None):
+        self.jobs = jobs
+        self.cachedir = cachedir
+        self.specs = []
+        self.hits = 0
+        self.misses = 0
+
+
+    def add_go(self, gomap, ontology, alpha):
+
+        """
+        Requests a (topGO) GO term enrichment for the given ontology.
+        """
+
+        self.specs.append(("GO", (gomap, ontology, alpha)))
+
+
+    def add_kegg(self, keggmap, alpha, organism):
+
+        """
+        Requests a (GOstats) KEGG pathway enrichment.
+        """
+
+        self.specs.append(("KEGG", (keggmap, alpha, organism)))
+
+
+    def run(self, targetpaths):
+
+        """
+        Runs every requested enrichment for every set file. Yields a
+        (enrichment label, set file, error, cache stats) tuple as each task
+        finishes, with error being None or the traceback of the failure and the
+        stats being the task's {"hits": n, "misses": n} result cache counts.
+        Raises RuntimeError if R was already started in this process.
+        """
+
+        if r_started():
+            raise RuntimeError("R is already running in this process (rpy2.robjects or 'enricher' "
+                               "was imported), so the enrichment workers cannot be forked from it!")
+
+        tasks = [(i, t) for t in targetpaths for i in range(len(self.specs))]
+
+        pool = multiprocessing.Pool(self.jobs, initializer=init_worker,
+                                    initargs=(self.specs, self.cachedir))
+        try:
+            for result in pool.imap_unordered(run_task, tasks):
+                self.hits += result[3]["hits"]
+                self.misses += result[3]["misses"]
+                yield result
+        finally:
+            pool.close()
+            pool.join()
+
+
+    def stats(self):
+
+        # result cache hits and misses of all the tasks run so far
+        return {"hits": self.hits, "misses": self.misses}
+
+# -------------------------------------------------------------------------------
+
+def r_started():
+
+    # importing rpy2.robjects (as 'enricher' does) starts the embedded R
+    return sys.modules.get("rpy2.robjects") is not None
+
+
+
+# (label, enrichment object) pairs of a worker process (built by init_worker)
+ENGINES = []
+
+def init_worker(specs, cachedir):
+
+    """
+    Starts the worker's embedded R and builds the requested enrichment objects
+    (sharing a result cache, if requested); these load their R packages and
+    mappings on their first cache miss.
+    """
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    import enricher
+
+    if cachedir is not None:
+        cache = ResultCache(cachedir)
+    else:
+        cache = None
+
+    for kind, params in specs:
+        if kind == "GO":
+            ENGINES.append(("GO " + params[1], enricher.GOrich(*params, cache=cache)))
+        else:
+            ENGINES.append(("KEGG", enricher.KEGGer(*params, cache=cache)))
+
+
+
+def run_task(task):
+
+    """
+    Runs one enrichment (by index into ENGINES) for one set file. Returns the
+    (label, set file, error, cache stats) tuple yielded by EnrichmentExecutor.run.
+    """
+
+    i, targetspath = task
+    label, engine = ENGINES[i]
+
+    # (the worker's cache counts are cumulative, so only the task's own are sent back)
+    before = engine.cache.stats() if engine.cache is not None else {"hits": 0, "misses": 0}
+
+    try:
+        engine.enrich_many([targetspath])
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+
+    after = engine.cache.stats() if engine.cache is not None else before
+
+    return label, targetspath, error, dict((k, after[k] - before[k]) for k in before)
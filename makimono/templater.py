@@ -1,13 +1,19 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-import os, re
-import pandas as pd
-from jinja2 import Template
-from bokeh.resources import INLINE
+import os, re, json
+from jinja2 import Environment, FileSystemLoader
+
+from assets import asset_urls
+from toolbox import import_pandas
+
+# Templates are read from the package's templates/ folder and compiled only once
+# (per process), on first use; every Templater shares them.
+ENV = Environment(loader=FileSystemLoader(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                       "templates")))
+
+NOT_FOUND = '<br/>No significant enriched terms found!<br/>'
 
-pd.set_option('display.max_colwidth', -1)
-pd.options.mode.chained_assignment = None  # default='warn'
 
 class Templater(object):
 
@@ -27,44 +33,25 @@ class Templater(object):
         results.     
         """
 
-        # TODO: make css customizing accessible
-        csstables = '''
-                    <style type="text/css">
-                        .etables {
-                            dir: ltr;
-                            width: 1200px;
-                        }
-                    </style>
-                    '''
-
-        # Hardcoded, but (for the time being) it is for the best.
-        # NOTE: if changed in the future, remember to keep paths relative.
-        if portability == "batch":
-            css_resources = '<link rel="stylesheet" href="static/bokeh-0.11.1.min.css" type="text/css" />'
-            js_resources = '''
-                            <script type="text/javascript" src="static/bokeh-0.11.1.min.js"></script>
-                                <script type="text/javascript">
-                                    Bokeh.set_log_level("info");
-                                </script>
-                           '''
-
-        elif portability == "web":
-
-            css_resources = '''
-                <link rel="stylesheet" href="https://cdn.pydata.org/bokeh/release/bokeh-0.11.1.min.css" type="text/css" />'''+csstables
-            js_resources = '''
-                <script type="text/javascript" src="https://cdn.pydata.org/bokeh/release/bokeh-0.11.1.min.js"></script>
-                <script type="text/javascript">
-                    Bokeh.set_log_level("info");
-                </script>
-
-                           '''
-        # or "full", meaning full portability, but at a cost of increased filesize
-        else:            
-            js_resources = INLINE.render_js()
-            css_resources = INLINE.render_css()
+        return ENV.get_template("main.html").render(**self.main_page_context(portability, plus))
+
+
+    def stream_main_page(self, fh, portability, plus = None):
 
-    # ----------------------------------------------------------------------------
+        """
+        Same as render_main_page, but the page is streamed straight into an
+        (already opened) output file instead of being built as a string.
+        """
+
+        ENV.get_template("main.html").stream(**self.main_page_context(portability, plus)).dump(fh)
+
+
+    def main_page_context(self, portability, plus):
+
+        """
+        Gathers the main page template variables. Enrichment sections whose
+        results are not available are left out (None).
+        """
 
         if plus is not None:
 
@@ -86,100 +73,37 @@ class Templater(object):
 
         t_bp, t_mf, t_cc, t_kegg = self.process_enrichment_dict(bp, mf, cc, kegg, alpha)
 
+        # the "all" portability mode inlines the bokeh resources, while "batch"
+        # pages point to the output folder's local copy (see assets.ensure_assets)
+        js_resources = None
+        css_resources = None
+        static_js, static_css = [], []
 
-        if bp is not None or mf is not None or cc is not None:
-            goheader = '''<p style="font-size:20px; font-weight: bold;">GO term enrichment</p>'''
-        else:
-            goheader = ""
-
-
-        if bp is not None:
-            bp_info = '''
-            <span style="font-size:16px; font-weight: bold;">Biological Process</span>
-            {% block table1a %}
-            {{ tablegobp }}
-            {% endblock %}
-            <br/>
-            '''
-
-        else:
-            bp_info = ""         
-
-        if mf is not None:
-            mf_info = '''        
-            <span style="font-size:16px; font-weight: bold;">Molecular Function</span>
-            {% block table1b %}
-            {{ tablegomf }}
-            {% endblock %}
-            <br/>
-            '''
-        else:
-            mf_info = ""
-
-        if cc is not None:
-            cc_info = '''        
-            <span style="font-size:16px; font-weight: bold;">Cellular Component</span>
-            {% block table1c %}
-            {{ tablegocc }}
-            {% endblock %}
-            <br/>
-            <br/>
-            '''
-        else:
-            cc_info = ""
+        if portability == "batch":
+            static_js, static_css = asset_urls()
+        elif portability != "web":
+            from bokeh.resources import INLINE
+            js_resources = INLINE.render_js()
+            css_resources = INLINE.render_css()
 
-        if kegg is not None:
-            kegg_info = '''
-            <span style="font-size:20px; font-weight: bold;">KEGG pathways enrichment</span>
-            {% block table2 %}
-            {{ tablekegg }}
-            {% endblock %}
-            <br/>
-            '''
-        else:
-            kegg_info = ""
-
-    # ----------------------------------------------------------------------------
-
-        template = Template('''<!DOCTYPE html>
-        <html lang="en">
-            <head>
-                <meta charset="latin-1">
-                <title>{{ title }}</title>
-                {{ js_resources }}
-                {{ css_resources }}
-                {{ script }}
-            </head>
-            <body>
-                {{ div }}
-                <br/>
-
-                <br/>
-                '''+goheader+bp_info+mf_info+cc_info+kegg_info+
-                ''' 
-                {% block table3 %}
-                {{ annots }}
-                {% endblock %}
-
-            </body>
-        </html>
-        ''')
-
-        html = template.render(js_resources=js_resources,
-                               css_resources=css_resources,
-                               script=self.script,
-                               div=self.div,
-                               title = self.title,
-                               tablegobp = t_bp,
-                               tablegomf = t_mf,
-                               tablegocc = t_cc,
-                               tablekegg = t_kegg,                           
-                               annots = self.render_gene_table(),
-                               )
-        return html
+        return dict(portability=portability,
+                    js_resources=js_resources,
+                    css_resources=css_resources,
+                    static_js=static_js,
+                    static_css=static_css,
+                    script=self.script,
+                    div=self.div,
+                    title=self.title,
+                    tablegobp=t_bp if bp is not None else None,
+                    tablegomf=t_mf if mf is not None else None,
+                    tablegocc=t_cc if cc is not None else None,
+                    tablekegg=t_kegg if kegg is not None else None,
+                    genedata=self.annots,
+                    generows=gene_rows(self.annots))
  
 
-    # make Jinja2 table template for gene/transcript annotation data/list
+    # Gene/transcript annotation table: the rows are embedded as JSON and
+    # paged/searched/sorted in the browser (see templates/genetable.js.html).
     # NOTE: Currently all available annotations per gene/transcript are
     # dumped into a single cell. TODO: ponder the best way to improve that!
     # Maybe a scarse matrix-like table via pandas dataframe? 
@@ -192,38 +116,10 @@ class Templater(object):
         all available annotations.
         """
 
-        tablegene = Template('''<span style="font-size:20px; font-weight: bold;">
-                                Genes/transcripts</span>
-                            <table dir="ltr" width="1200" border="1">                   
-                            <thead>
-                                <tr>
-	                                <th scope="col">Identifier</th>
-		                            <th scope="col">Annotations</th>    
-                                </tr>
-                            </thead>
-                            <tbody>
-                                {% for key in genedata: %}
-                                    {% if genedata[key][0].strip() !="": %}
-                                    <tr>
-                                        <td>
-                                        {{ key }}
-                                        </td>
-                                        <td>
-                                        {{ genedata[key][0].strip() }}
-                                        </td>
-                                    </tr>
-                                    {% endif %}                    
-                                {% endfor %}
-                                <br/>
-
-                            </tbody>
-                        </table>
-                        ''')
-
         if len(self.annots) > 0:
-            table = tablegene.render(genedata=self.annots)
+            table = ENV.get_template("genetable.html").render(generows=gene_rows(self.annots))
         else:
-            table = Template("").render()
+            table = ""
 
         return table
 
@@ -238,6 +134,10 @@ class Templater(object):
         converts them into html tables.
         """
 
+        # (for its display options; the dataframes were read with it already)
+        if any(df is not None for df in [gobp, gomf, gocc, kegg]):
+            import_pandas()
+
         if gobp is not None:
             bpslice = gobp.loc[gobp['elimFisher'] < alpha]
             if len(bpslice) > 0:
@@ -283,6 +183,23 @@ class Templater(object):
     # render this line when no GO terms found to be enriched 
     def not_found_response(self):
 
-        tablego = Template('<br/>No significant enriched terms found!<br/>')
-        table = tablego.render()
-        return table
+        return NOT_FOUND
+
+
+
+# ===============================================================================
+
+def gene_rows(annots):
+
+    """
+    Returns the [identifier, annotation] rows of the genes/transcripts that have
+    an annotation, as JSON that can be inlined in a <script> element.
+    """
+
+    rows = []
+    for key in annots:
+        annotation = annots[key][0].strip()
+        if annotation != "":
+            rows.append([key, annotation])
+
+    return json.dumps(rows, separators=(",", ":")).replace("</", "<\\/")
@@ -0,0 +1,195 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os, shutil, tempfile, unittest
+import numpy as np
+
+from makimono import toolbox
+from makimono.cache import ExpressionCache, ResultCache
+
+# ========================================================================================
+
+LINES = ["g1\t1\t3\t10\t20\n", "g2\t0\t0\t4\t6\n", "g3\t5\t5\t5\t5\n"]
+
+class ExpressionCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cachedir = os.path.join(self.folder, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, name, lines=LINES):
+        path = os.path.join(self.folder, name)
+        with open(path, "w") as fh:
+            fh.writelines(lines)
+        return path
+
+
+    def test_round_trip(self):
+        path = self.write("expr.tsv")
+        cache = ExpressionCache(self.cachedir)
+
+        parsed = toolbox.process_expression_values(open(path), 2, cache=cache)
+        cached = toolbox.process_expression_values(open(path), 2, cache=cache)
+
+        self.assertEqual(cached.ids, ["g1", "g2", "g3"])
+        np.testing.assert_array_equal(cached.matrix, parsed.matrix)
+        np.testing.assert_array_equal(cached["g1"], [3, 16])
+
+
+    def test_bulk_runs_fill_the_cache(self):
+        path = self.write("expr.tsv")
+        cache = ExpressionCache(self.cachedir)
+
+        missed = toolbox.process_expression_values(open(path), 2, cache=cache, keep=set(["g3", "g1", "gX"]))
+        data = cache.load(path, 2)
+
+        self.assertIsNotNone(data)
+        self.assertEqual(data.ids, ["g1", "g2", "g3"])
+
+        # (both the run that filled the cache and the ones reading it only get the kept rows)
+        hit = toolbox.process_expression_values(open(path), 2, cache=cache, keep=set(["g3", "g1", "gX"]))
+        for kept in [missed, hit]:
+            self.assertEqual(kept.ids, ["g1", "g3"])
+            np.testing.assert_array_equal(kept.matrix, data.matrix[[0, 2]])
+
+
+    def test_without_cache_keep_skips_rows(self):
+        path = self.write("expr.tsv")
+        data = toolbox.process_expression_values(open(path), 2, keep=set(["g2"]))
+        self.assertEqual(data.ids, ["g2"])
+
+
+    def test_pseudocount_is_part_of_the_key(self):
+        path = self.write("expr.tsv")
+        cache = ExpressionCache(self.cachedir)
+
+        toolbox.process_expression_values(open(path), 2, cache=cache)
+        self.assertIsNone(cache.load(path, 2, pseudocount=0.5))
+
+
+    def test_files_share_a_cache_folder(self):
+        one, two = self.write("one.tsv"), self.write("two.tsv", LINES[:2])
+        cache = ExpressionCache(self.cachedir)
+
+        for path in [one, two]:
+            toolbox.process_expression_values(open(path), 2, cache=cache)
+
+        records = [f for f in os.listdir(self.cachedir) if f.startswith("source")]
+        self.assertEqual(len(records), 2)
+        self.assertEqual(len(cache.load(one, 2)), 3)
+        self.assertEqual(len(cache.load(two, 2)), 2)
+
+
+    def test_only_the_latest_entry_is_kept(self):
+        one, two = self.write("one.tsv"), self.write("two.tsv", LINES[:2])
+        cache = ExpressionCache(self.cachedir)
+
+        os.makedirs(self.cachedir)
+        for old in ["0" * 40 + ".npy", "0" * 40 + ".ids", "source.json"]:
+            open(os.path.join(self.cachedir, old), "w").close()
+
+        toolbox.process_expression_values(open(two), 2, cache=cache)
+        toolbox.process_expression_values(open(one), 2, cache=cache)
+        toolbox.process_expression_values(open(one), 2, cache=cache, pseudocount=0.5)
+        self.write("one.tsv", LINES[1:])
+        os.utime(one, (0, 0))
+        toolbox.process_expression_values(open(one), 1, cache=cache)
+
+        entries = [f for f in os.listdir(self.cachedir) if not f.startswith("source-")]
+        self.assertEqual(len(entries), 4)
+        self.assertEqual(len(cache.load(one, 1)), 2)
+        self.assertEqual(len(cache.load(two, 2)), 2)
+
+
+    def test_non_regular_files_are_not_cached(self):
+        read, write = os.pipe()
+        os.write(write, "".join(LINES))
+        os.close(write)
+
+        cache = ExpressionCache(self.cachedir)
+        with os.fdopen(read) as fh:
+            data = toolbox.process_expression_values(fh, 2, cache=cache)
+
+        self.assertEqual(len(data), 3)
+        self.assertFalse(os.path.isdir(self.cachedir))
+
+# ========================================================================================
+
+class ResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.mappings = os.path.join(self.folder, "gene2go.tsv")
+        self.outname = os.path.join(self.folder, "set_enrichment.tsv")
+        with open(self.mappings, "w") as fh:
+            fh.write("g1\tGO:0006412\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+
+    def test_round_trip(self):
+        cache = ResultCache(os.path.join(self.folder, "cache"))
+        key = cache.key(["g2", "g1"], self.mappings, "GO BP", 0.05)
+
+        self.assertFalse(cache.fetch(key, self.outname))
+        with open(self.outname, "w") as fh:
+            fh.write("GO.ID\tTerm\n")
+        cache.store(key, self.outname)
+        os.remove(self.outname)
+
+        self.assertTrue(cache.fetch(cache.key(["g1", "g2"], self.mappings, "GO BP", 0.05), self.outname))
+        self.assertEqual(open(self.outname).read(), "GO.ID\tTerm\n")
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1})
+
+
+    def test_sets_without_results_are_remembered(self):
+        cache = ResultCache(os.path.join(self.folder, "cache"))
+        key = cache.key(["x1"], self.mappings, "GO BP", 0.05)
+
+        # the set had no genes mapped: the next run is a hit, and clears stale results
+        self.assertFalse(cache.fetch(key, self.outname))
+        cache.store(key)
+
+        with open(self.outname, "w") as fh:
+            fh.write("stale\n")
+
+        self.assertTrue(cache.fetch(key, self.outname))
+        self.assertFalse(os.path.exists(self.outname))
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1})
+
+
+    def test_missing_result_is_not_cached(self):
+        cache = ResultCache(os.path.join(self.folder, "cache"))
+        key = cache.key(["g1"], self.mappings, "GO BP", 0.05)
+
+        cache.store(key, self.outname)
+
+        self.assertEqual(os.listdir(cache.cachedir), [])
+        self.assertFalse(cache.fetch(key, self.outname))
+
+
+    def test_least_recently_used_are_evicted(self):
+        cache = ResultCache(os.path.join(self.folder, "cache"), maxbytes=250)
+        scans = []
+        evict = cache.evict
+        cache.evict = lambda: scans.append(1) or evict()
+
+        keys = [cache.key(["g%d" % i], self.mappings, "GO BP", 0.05) for i in range(5)]
+        for i, key in enumerate(keys):
+            with open(self.outname, "w") as fh:
+                fh.write("x" * 100)
+            cache.store(key, self.outname)
+            os.utime(os.path.join(cache.cachedir, key + ".tsv"), (i, i))
+
+        # (the folder is scanned on the first store, then only by the three that outgrew the limit)
+        self.assertEqual(sorted(os.listdir(cache.cachedir)), sorted(k + ".tsv" for k in keys[3:]))
+        self.assertEqual(len(scans), 4)
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import unittest
+import numpy as np
+
+from makimono import clustering
+from makimono.expression import ExpressionMatrix
+
+# ========================================================================================
+
+# three tight groups of points, far apart from each other
+GROUPS = [np.array([0.0, 0.0]), np.array([100.0, 0.0]), np.array([0.0, 100.0])]
+
+def grouped(size=20, seed=1):
+    rs = np.random.RandomState(seed)
+    features = np.vstack([center + rs.normal(scale=0.01, size=(size, 2)) for center in GROUPS])
+    return features, np.repeat(np.arange(len(GROUPS)), size)
+
+
+
+class SeedingTest(unittest.TestCase):
+
+    def test_centers_come_from_distinct_groups(self):
+        features, groups = grouped()
+
+        for seed in range(10):
+            centers = clustering.initial_centers(features, 3, np.random.RandomState(seed), chunksize=7)
+            picked = [groups[(features == c).all(axis=1)][0] for c in centers]
+            self.assertEqual(sorted(picked), [0, 1, 2])
+
+
+    def test_seeding_is_reproducible(self):
+        features = grouped()[0]
+
+        first = clustering.initial_centers(features, 3, np.random.RandomState(4))
+        second = clustering.initial_centers(features, 3, np.random.RandomState(4))
+
+        np.testing.assert_array_equal(first, second)
+
+
+    def test_identical_rows(self):
+        features = np.ones((5, 3))
+
+        centers = clustering.initial_centers(features, 3, np.random.RandomState(0))
+
+        np.testing.assert_array_equal(centers, np.ones((3, 3)))
+
+
+
+class AssignmentTest(unittest.TestCase):
+
+    def test_nearest_centers_match_brute_force(self):
+        rs = np.random.RandomState(2)
+        features, centers = rs.normal(size=(50, 4)), rs.normal(size=(6, 4))
+
+        labels, distances = clustering.nearest_centers(features, centers, chunksize=7)
+
+        expected = ((features[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        np.testing.assert_array_equal(labels, expected.argmin(axis=1))
+        np.testing.assert_allclose(distances, expected.min(axis=1))
+
+
+    def test_kmeans_recovers_the_groups(self):
+        features, groups = grouped()
+
+        labels, centers, inertia = clustering.kmeans(features, 3, chunksize=7)
+
+        # same partition, whatever the numbering of the clusters
+        self.assertEqual(len(set(zip(labels, groups))), 3)
+        np.testing.assert_allclose(centers[labels], np.array(GROUPS)[groups], atol=0.1)
+        self.assertAlmostEqual(inertia, ((features - centers[labels]) ** 2).sum())
+
+
+    def test_one_cluster_per_row(self):
+        features = grouped(size=2)[0]
+
+        labels, centers, inertia = clustering.kmeans(features, len(features))
+
+        self.assertEqual(sorted(labels), range(len(features)))
+        self.assertAlmostEqual(inertia, 0)
+
+
+    def test_invalid_input(self):
+        features = grouped(size=2)[0]
+
+        self.assertRaises(ValueError, clustering.kmeans, features, 0)
+        self.assertRaises(ValueError, clustering.kmeans, features, len(features) + 1)
+
+        features[3, 1] = -np.inf
+        self.assertRaises(ValueError, clustering.kmeans, features, 2)
+
+
+
+class ClusterSetsTest(unittest.TestCase):
+
+    def test_sets_largest_first(self):
+        matrix = np.array([[1, 10, 100]] * 3 + [[100, 10, 1]] * 2, dtype=float)
+        data = ExpressionMatrix(["a", "b", "c", "d", "e"], matrix)
+
+        sets = clustering.cluster_sets(data, 2)
+
+        self.assertEqual(sets.items(), [("000_cluster", ["a", "b", "c"]), ("001_cluster", ["d", "e"])])
+
+
+    def test_nothing_to_cluster(self):
+        data = ExpressionMatrix([], np.empty((0, 3)))
+
+        self.assertRaises(ValueError, clustering.cluster_sets, data, 0)
+
+
+    def test_log_of_zero(self):
+        data = ExpressionMatrix(["a", "b", "c"], [[1, 2, 3], [0, 2, 3], [3, 2, 1]])
+
+        self.assertRaises(ValueError, clustering.cluster_sets, data, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os, json, shutil, tempfile, unittest
+import numpy as np
+
+from makimono.dashboard import Dashboard
+from makimono.expression import ExpressionMatrix
+
+# ========================================================================================
+
+class DashboardTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def script(self, name):
+        with open(os.path.join(self.folder, "data", name)) as fh:
+            return json.loads(fh.read().splitlines()[1].split(" = ", 1)[1].rstrip(";"))
+
+
+    def test_values_are_written_as_they_are(self):
+        data = ExpressionMatrix(["g1", "g2", "g3"], np.array([[1.0, 2.5], [3.0, 4.0], [0.5, 0.25]]))
+
+        dashboard = Dashboard(data, [0, 1], [0, 1], ylabel="log2 normalized expression counts")
+        dashboard.add_set("one", ["g3", "g1"])
+        dashboard.add_set("two", ["g1"])
+        dashboard.write(self.folder)
+
+        expression = self.script("expression.js")
+        self.assertEqual(expression["ids"], ["g3", "g1"])
+        self.assertEqual(expression["values"], [[0.5, 0.25], [1.0, 2.5]])
+        self.assertEqual(expression["ylabel"], "log2 normalized expression counts")
+        self.assertEqual([s["rows"] for s in self.script("sets.js")], [[0, 1], [1]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os, sys, shutil, tempfile, subprocess, unittest
+
+from makimono.cache import ResultCache
+from makimono.overrep import NativeKEGGer
+
+# these tests run the R based enrichments, so they need rpy2 and the R packages
+try:
+    from rpy2.robjects.packages import importr
+    for package in ["topGO", "GOstats", "GSEABase", "KEGG.db"]:
+        importr(package)
+    from rpy2 import robjects
+    from makimono import enricher
+    HAVE_R = True
+except Exception:
+    HAVE_R = False
+
+# ========================================================================================
+
+# forty genes in four groups, each annotated to one (BP, MF, CC) triplet of GO terms
+GROUPS = [("GO:0006412", "GO:0003735", "GO:0005840"),     # translation, ribosome
+          ("GO:0055085", "GO:0005215", "GO:0016020"),     # transmembrane transport, membrane
+          ("GO:0006096", "GO:0003824", "GO:0005737"),     # glycolysis, catalytic, cytoplasm
+          ("GO:0006281", "GO:0003677", "GO:0005634")]     # DNA repair, DNA binding, nucleus
+
+# ... and in one KEGG pathway (ribosome, ABC transporters, glycolysis, base excision repair)
+PATHWAYS = ["03010", "02010", "00010", "03410"]
+ORGANISM = "Chlamydomonas reinhardtii"
+
+GENES = ["g%02d" % i for i in range(1, 41)]
+
+# sets enriched in different groups (with a stray member each)
+SETS = [GENES[0:8] + ["g25"], GENES[10:18] + ["g31"], GENES[20:29], GENES[32:39] + ["g02"]]
+
+
+class RTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.gomap = self.write("gene2go.tsv", ["%s\t%s\n" % (g, ", ".join(GROUPS[i // 10]))
+                                                for i, g in enumerate(GENES)])
+        self.keggmap = self.write("keggmap.tsv", ["%s\t%s\n" % (PATHWAYS[i // 10], g)
+                                                  for i, g in enumerate(GENES)])
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, name, lines):
+        path = os.path.join(self.folder, name)
+        with open(path, "w") as fh:
+            fh.writelines(lines)
+        return path
+
+    def write_sets(self):
+        return [self.write("set%d.txt" % i, ["%s\n" % g for g in genes]) for i, genes in enumerate(SETS)]
+
+    def result(self, setfile, enrich):
+        path = os.path.join(self.folder, enrich, os.path.splitext(os.path.basename(setfile))[0]
+                            + "_enrichment.tsv")
+        if not os.path.isfile(path):
+            return None
+        with open(path) as fh:
+            return fh.read()
+
+
+
+@unittest.skipUnless(HAVE_R, "needs rpy2 and the topGO, GOstats, GSEABase and KEGG.db R packages")
+class GOrichTest(RTestCase):
+
+    def test_ontologies(self):
+        setfiles = self.write_sets()
+        gorichs = []
+
+        for ontology in ["BP", "MF", "CC"]:
+            gorichs.append(enricher.GOrich(self.gomap, ontology, 0.05))
+            gorichs[-1].enrich_many(setfiles[:1])
+            lines = self.result(setfiles[0], "goenrich/" + ontology).splitlines()
+
+            self.assertEqual(lines[0].split("\t"), ["GO.ID", "Term", "Annotated", "Significant", "Expected",
+                                                    "Rank in classicFisher", "classicFisher", "elimFisher"])
+            self.assertTrue(len(lines) > 1)
+
+        # the translation genes: the deepest term comes first, its ancestors are elim'ed
+        lines = self.result(setfiles[0], "goenrich/BP").splitlines()
+        self.assertEqual(lines[1].split("\t")[0], "GO:0006412")
+
+        # the three ontologies share the environment the mappings were read into,
+        # and nothing is left in globalenv
+        for gorich in gorichs:
+            self.assertTrue(robjects.r["identical"](robjects.r["parent.env"](gorich.env),
+                                                    enricher.SHARED[("GO", self.gomap)])[0])
+        for name in ["id2go", "GOdata", "GOdataBase", "targetset", "outname"]:
+            self.assertFalse(name in robjects.globalenv.keys())
+
+
+    def test_reused_topgodata_matches_fresh(self):
+        # enrich_many builds topGOdata once and then calls updateGenes for every
+        # other set; a new GOrich builds a fresh topGOdata for its first set
+        setfiles = self.write_sets()
+
+        for ontology in ["BP", "MF", "CC"]:
+            enricher.GOrich(self.gomap, ontology, 0.05).enrich_many(setfiles)
+            batched = [self.result(s, "goenrich/" + ontology) for s in setfiles]
+
+            self.assertNotEqual(batched[0], None)
+            self.assertNotEqual(batched[0], batched[1])
+
+            for setfile, expected in zip(setfiles, batched):
+                enricher.GOrich(self.gomap, ontology, 0.05).enrich_many([setfile])
+                self.assertEqual(self.result(setfile, "goenrich/" + ontology), expected)
+
+
+    def test_cached_sets_skip_r(self):
+        setfiles = self.write_sets() + [self.write("unmapped.txt", ["x1\n", "x2\n"])]
+        cache = ResultCache(os.path.join(self.folder, "cache"))
+
+        enricher.GOrich(self.gomap, "BP", 0.05, cache=cache).enrich_many(setfiles)
+        expected = [self.result(s, "goenrich/BP") for s in setfiles]
+
+        # every set is a hit (with or without a result): no R environment is built
+        gorich = enricher.GOrich(self.gomap, "BP", 0.05, cache=cache)
+        gorich.enrich_many(setfiles)
+
+        self.assertEqual(gorich.env, None)
+        self.assertEqual([self.result(s, "goenrich/BP") for s in setfiles], expected)
+        self.assertEqual(cache.stats(), {"hits": len(setfiles), "misses": len(setfiles)})
+
+
+
+
+@unittest.skipUnless(HAVE_R, "needs rpy2 and the topGO, GOstats, GSEABase and KEGG.db R packages")
+class KEGGerTest(RTestCase):
+
+    def test_matches_native_engine(self):
+        setfiles = self.write_sets()
+
+        enricher.KEGGer(self.keggmap, 0.05, ORGANISM).enrich_many(setfiles)
+        native = NativeKEGGer(self.keggmap, 0.05).test_sets(SETS)
+
+        for setfile, rows in zip(setfiles, native):
+            lines = [line.split("\t") for line in self.result(setfile, "keggenrich").splitlines()]
+
+            self.assertEqual(lines[0], ["KEGGID", "Pvalue", "OddsRatio", "ExpCount", "Count", "Size", "Term"])
+            self.assertEqual([line[0] for line in lines[1:]], [row[0] for row in rows])
+
+            for line, row in zip(lines[1:], rows):
+                self.assertAlmostEqual(float(line[1]), row[1])
+                self.assertEqual((int(line[4]), int(line[5])), row[4:6])
+
+
+    def test_failures_are_not_cached(self):
+        setfiles = self.write_sets()[:1] + [self.write("unmapped.txt", ["x1\n", "x2\n"])]
+        cache = ResultCache(os.path.join(self.folder, "cache"))
+
+        # (a folder in the way of the result file: write.table fails)
+        os.makedirs(os.path.join(self.folder, "keggenrich", "set0_enrichment.tsv"))
+
+        enricher.KEGGer(self.keggmap, 0.05, ORGANISM, cache=cache).enrich_many(setfiles)
+
+        # only the unmapped set is remembered (as having no result)
+        entries = os.listdir(cache.cachedir)
+        self.assertEqual(len(entries), 1)
+        self.assertTrue(entries[0].endswith(".none"))
+
+
+
+@unittest.skipUnless(HAVE_R, "needs rpy2 and the topGO, GOstats, GSEABase and KEGG.db R packages")
+class EnrichmentExecutorTest(RTestCase):
+
+    def test_workers(self):
+        # (from a fresh interpreter: R is already running in this one)
+        setfiles = self.write_sets()
+        code = ("from makimono.rpool import EnrichmentExecutor\n"
+                "executor = EnrichmentExecutor(2)\n"
+                "executor.add_go(%r, 'BP', 0.05)\n"
+                "executor.add_kegg(%r, 0.05, %r)\n"
+                "for label, setfile, error, cached in executor.run(%r):\n"
+                "    assert error is None, error\n" % (self.gomap, self.keggmap, ORGANISM, setfiles))
+
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        subprocess.check_call([sys.executable, "-c", code], env=dict(os.environ, PYTHONPATH=root))
+
+        for setfile in setfiles:
+            self.assertNotEqual(self.result(setfile, "goenrich/BP"), None)
+            self.assertNotEqual(self.result(setfile, "keggenrich"), None)
+
+# ========================================================================================
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os, time, shutil, sqlite3, tempfile, unittest
+
+from makimono import toolbox
+from makimono.enrichstore import EnrichmentStore
+
+# ========================================================================================
+
+HEADER = "GO.ID\tTerm\tAnnotated\tSignificant\tExpected\tRank in classicFisher\tclassicFisher\telimFisher\n"
+ROW = "GO:%07d\tterm %d\t10\t8\t2.25\t%d\t1.2e-06\t%s\n"
+
+class EnrichmentStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.sets = os.path.join(self.folder, "sets")
+        self.store = EnrichmentStore(os.path.join(self.folder, "enrichment.db"))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, basename, rows, folder="goenrich/BP", sets=None):
+        path = os.path.join(sets or self.sets, folder)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        path = os.path.join(path, basename + "_enrichment.tsv")
+        with open(path, "w") as fh:
+            fh.write(HEADER + "".join(ROW % (i, i, i, "< 1e-30") for i in range(1, rows + 1)))
+        return path
+
+    def terms(self, basename, sets=None):
+        frame = self.store.frames(sets or self.sets, basename, 0.05)["bp"]
+        return None if frame is None else list(frame["GO.ID"])
+
+
+    def test_import(self):
+        self.write("one", 2)
+        self.write("two", 1)
+
+        self.assertEqual(self.store.import_tree(self.sets), 2)
+        self.assertEqual(self.terms("one"), ["GO:0000001", "GO:0000002"])
+        self.assertEqual(self.terms("two"), ["GO:0000001"])
+        self.assertEqual(self.store.frames(self.sets, "two", 0.05)["mf"], None)
+
+        # nothing changed: nothing is re-imported
+        self.assertEqual(self.store.import_tree(self.sets), 0)
+        self.assertEqual(len(self.store.significant_terms("one", 0.05)), 2)
+
+
+    def test_changed_files_are_reimported(self):
+        path = self.write("one", 2)
+        self.store.import_tree(self.sets)
+
+        self.write("one", 3)
+        os.utime(path, (time.time() + 10, time.time() + 10))
+
+        self.assertEqual(self.store.import_tree(self.sets), 1)
+        self.assertEqual(self.terms("one"), ["GO:0000001", "GO:0000002", "GO:0000003"])
+
+
+    def test_removed_files_are_deleted(self):
+        self.write("one", 2)
+        path = self.write("two", 1)
+        self.store.import_tree(self.sets)
+
+        os.remove(path)
+        self.store.import_tree(self.sets)
+
+        self.assertEqual(self.terms("two"), None)
+        self.assertEqual(len(self.store.sets_enriched_for("GO:0000001", 0.05)), 1)
+
+
+    def test_header_only_file_is_an_empty_frame(self):
+        self.write("empty", 0)
+        self.store.import_tree(self.sets)
+
+        stored = self.store.frames(self.sets, "empty", 0.05)["bp"]
+        read = toolbox.process_enrichment_values(self.sets, "empty", 0.05)["bp"]
+
+        self.assertEqual(len(stored), 0)
+        self.assertEqual(list(stored.columns), list(read.columns))
+
+
+    def test_sets_folders_are_kept_apart(self):
+        other = os.path.join(self.folder, "other")
+        self.write("one", 2)
+        self.write("one", 1, sets=other)
+        self.store.import_tree(self.sets)
+        self.store.import_tree(other)
+
+        self.assertEqual(self.terms("one"), ["GO:0000001", "GO:0000002"])
+        self.assertEqual(self.terms("one", sets=other), ["GO:0000001"])
+        self.assertEqual(len(self.store.significant_terms("one", 0.05, directory=other)), 1)
+        self.assertEqual(len(self.store.sets_enriched_for("GO:0000001", 0.05)), 2)
+
+        # (removing the other folder's file leaves this one's rows alone)
+        os.remove(os.path.join(other, "goenrich/BP", "one_enrichment.tsv"))
+        self.store.import_tree(other)
+
+        self.assertEqual(self.terms("one", sets=other), None)
+        self.assertEqual(self.terms("one"), ["GO:0000001", "GO:0000002"])
+
+
+    def test_stores_without_folders_are_rebuilt(self):
+        conn = sqlite3.connect(self.store.dbpath)
+        conn.executescript('CREATE TABLE enrichment ("set" TEXT, ontology TEXT); '
+                           'CREATE TABLE imported (path TEXT PRIMARY KEY);')
+        conn.close()
+
+        self.write("one", 2)
+
+        self.assertEqual(self.store.import_tree(self.sets), 1)
+        self.assertEqual(self.terms("one"), ["GO:0000001", "GO:0000002"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os, shutil, tempfile, unittest
+
+from makimono.manifest import BuildManifest
+
+# ========================================================================================
+
+class BuildManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.output = os.path.join(self.folder, "out")
+        os.makedirs(self.output)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def render(self, manifest, directory, f):
+        # records a set file of an input folder as rendered into <name>.png
+        name = os.path.splitext(f)[0] + ".png"
+        open(os.path.join(self.output, name), "w").close()
+        manifest.record(os.path.join(self.folder, directory, f), "key-" + directory, [name])
+        return name
+
+
+    def test_orphans_are_scoped_by_input_folder(self):
+        manifest = BuildManifest(self.output)
+        self.render(manifest, "a", "one.txt")
+        self.render(manifest, "a", "two.txt")
+        self.render(manifest, "b", "three.txt")
+        manifest.save()
+
+        # a run of folder b (where one.txt and two.txt never were) leaves a's outputs alone
+        manifest = BuildManifest(self.output)
+        self.assertEqual(manifest.orphans(os.path.join(self.folder, "b"), ["three.txt"]), [])
+
+        orphans = manifest.orphans(os.path.join(self.folder, "a"), ["one.txt"])
+        self.assertEqual(orphans, [os.path.join(self.folder, "a", "two.txt")])
+
+        manifest.remove(orphans[0])
+        self.assertEqual(sorted(os.listdir(self.output)), [".makisu-manifest.json", "one.png", "three.png"])
+        self.assertTrue(manifest.is_current(os.path.join(self.folder, "a", "one.txt"), "key-a"))
+
+
+    def test_replaced_outputs_are_forgotten(self):
+        manifest = BuildManifest(self.output)
+        self.render(manifest, "a", "one.txt")
+        self.render(manifest, "b", "one.txt")
+
+        # b/one.txt overwrote one.png: a/one.txt has to be rendered again
+        self.assertFalse(manifest.is_current(os.path.join(self.folder, "a", "one.txt"), "key-a"))
+        self.assertTrue(manifest.is_current(os.path.join(self.folder, "b", "one.txt"), "key-b"))
+        self.assertEqual(manifest.orphans(os.path.join(self.folder, "a"), []), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,198 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os, shutil, tempfile, unittest
+import numpy as np
+from scipy.stats import fisher_exact, hypergeom
+
+from makimono.overrep import GODag, NativeGOrich, NativeKEGGer
+
+# ========================================================================================
+
+# ten genes in three pathways (P3 is nested in P1)
+KEGGMAP = [("P1", "g1"), ("P1", "g2"), ("P1", "g3"), ("P1", "g4"),
+           ("P2", "g5"), ("P2", "g6"), ("P2", "g7"), ("P2", "g8"), ("P2", "g9"), ("P2", "g10"),
+           ("P3", "g1"), ("P3", "g2")]
+
+class NativeKEGGerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.keggmap = self.write("keggmap.tsv", ["%s\t%s\n" % pair for pair in KEGGMAP])
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, name, lines):
+        path = os.path.join(self.folder, name)
+        with open(path, "w") as fh:
+            fh.writelines(lines)
+        return path
+
+    def rows(self, genes, alpha=1.01, pathnames=None):
+        kegger = NativeKEGGer(self.keggmap, alpha, pathnames)
+        return dict((row[0], row) for row in kegger.test_sets([genes])[0])
+
+
+    def test_matches_fisher_exact(self):
+        genes = ["g1", "g2", "g3", "g5"]
+        rows = self.rows(genes)
+
+        for path, size in [("P1", 4), ("P2", 6), ("P3", 2)]:
+            members = set(g for p, g in KEGGMAP if p == path)
+            k = len(members & set(genes))
+            table = [[k, len(genes) - k], [size - k, 10 - size - len(genes) + k]]
+            odds, pvalue = fisher_exact(table, alternative="greater")
+
+            self.assertAlmostEqual(rows[path][1], pvalue)
+            self.assertAlmostEqual(rows[path][1], hypergeom.sf(k - 1, 10, size, len(genes)))
+            self.assertEqual(rows[path][2], odds)
+            self.assertAlmostEqual(rows[path][3], size * len(genes) / 10.0)
+            self.assertEqual(rows[path][4:6], (k, size))
+
+        # hand-computed: P1 is 3 of 4 drawn, C(4,3)C(6,1) + C(4,4)C(6,0) out of C(10,4)
+        self.assertAlmostEqual(rows["P1"][1], 25 / 210.0)
+        self.assertEqual(rows["P1"][2], 15.0)
+        self.assertAlmostEqual(rows["P2"][2], 1 / 15.0)
+        self.assertEqual(rows["P3"][2], np.inf)
+
+
+    def test_undefined_odds_ratio(self):
+        # drawing the whole universe: every pathway is fully hit and (n-k)(N-k) = k(M-n-N+k) = 0
+        rows = self.rows(["g%d" % i for i in range(1, 11)])
+
+        for path in ["P1", "P2", "P3"]:
+            self.assertAlmostEqual(rows[path][1], 1.0)
+            self.assertTrue(np.isnan(rows[path][2]))
+
+
+    def test_alpha_and_unmapped_sets(self):
+        kegger = NativeKEGGer(self.keggmap, 0.05)
+        hits, unmapped = kegger.test_sets([["g1", "g2", "g3", "g4"], ["x1", "x2"]])
+
+        # P1: 1/C(10,4); P3 (C(8,2)/C(10,4)) is above alpha and P2 is not hit at all
+        self.assertEqual([row[0] for row in hits], ["P1"])
+        self.assertAlmostEqual(hits[0][1], 1 / 210.0)
+        self.assertEqual(unmapped, None)
+
+
+    def test_result_file(self):
+        target = self.write("set.txt", ["g1\n", "g2\n", "g3\n", "g9\n"])
+        NativeKEGGer(self.keggmap, 1.01).enrich_many([target])
+
+        with open(os.path.join(self.folder, "keggenrich", "set_enrichment.tsv")) as fh:
+            lines = [line.rstrip("\n").split("\t") for line in fh]
+
+        self.assertEqual(lines[0], ["KEGGID", "Pvalue", "OddsRatio", "ExpCount", "Count", "Size", "Term"])
+        self.assertEqual([line[0] for line in lines[1:]], ["P1", "P3", "P2"])
+        self.assertEqual([line[6] for line in lines[1:]], ["NA", "NA", "NA"])
+        self.assertEqual(lines[2][2], "Inf")
+
+        # ... with names for some of the pathways
+        pathnames = self.write("names.tsv", ["P1\tGlycolysis\n"])
+        rows = self.rows(["g1", "g2", "g3", "g9"], pathnames=pathnames)
+        self.assertEqual(rows["P1"][6], "Glycolysis")
+        self.assertEqual(rows["P2"][6], "NA")
+
+# ========================================================================================
+
+# root <- A <- {B, D} and root <- C (BP), plus an MF term; B and D share g1 and g2
+NAMES = {"GO:R": "root", "GO:A": "term A", "GO:B": "term B", "GO:C": "term C",
+         "GO:D": "term D", "GO:M": "molecular term"}
+NAMESPACE = dict((t, "BP") for t in NAMES)
+NAMESPACE["GO:M"] = "MF"
+PARENTS = {"GO:R": [], "GO:A": ["GO:R"], "GO:B": ["GO:A"], "GO:D": ["GO:A"], "GO:C": ["GO:R"],
+           "GO:M": []}
+GENE2GO = {"g1": ["GO:B", "GO:D"], "g2": ["GO:B", "GO:D"], "g3": ["GO:B"], "g4": ["GO:A"],
+           "g5": ["GO:OLD"], "g6": ["GO:C"], "g7": ["GO:C"], "g8": ["GO:R"], "g9": ["GO:R"],
+           "g10": ["GO:R"], "g11": ["GO:M"]}
+
+# (all p-values below are out of C(10,4) = 210 draws of four genes)
+INTERESTING = ["g1", "g2", "g3", "g4", "x1"]
+
+class NativeGOrichTest(unittest.TestCase):
+
+    def gorich(self, cutoff):
+        dag = GODag(NAMES, NAMESPACE, PARENTS, {"GO:OLD": "GO:A"})
+        return NativeGOrich(GENE2GO, "BP", 0.05, dag, topnodes=3, cutoff=cutoff)
+
+    def pvalues(self, gorich, genes):
+        classic, elim, sigcounts, sigtotal = gorich.test_sets([genes])[0]
+        return (dict(zip(gorich.terms, classic)), dict(zip(gorich.terms, elim)),
+                dict(zip(gorich.terms, sigcounts)), sigtotal)
+
+
+    def test_annotations(self):
+        gorich = self.gorich(0.01)
+
+        # MF-only g11 is not part of the BP universe, g5's alternative id maps to A
+        self.assertEqual(gorich.universe, sorted("g%d" % i for i in range(1, 11)))
+        self.assertEqual(gorich.terms[-1], "GO:R")
+        self.assertEqual(dict(zip(gorich.terms, gorich.sizes)),
+                         {"GO:R": 10, "GO:A": 5, "GO:B": 3, "GO:D": 2, "GO:C": 2})
+
+
+    def test_classic(self):
+        gorich = self.gorich(0.01)
+        classic, elim, sigcounts, sigtotal = self.pvalues(gorich, INTERESTING)
+
+        self.assertEqual(sigtotal, 4)
+        self.assertAlmostEqual(classic["GO:B"], 7 / 210.0)      # C(3,3)C(7,1)
+        self.assertAlmostEqual(classic["GO:A"], 5 / 210.0)      # C(5,4)C(5,0)
+        self.assertAlmostEqual(classic["GO:D"], 28 / 210.0)     # C(2,2)C(8,2)
+        self.assertAlmostEqual(classic["GO:C"], 1.0)
+        self.assertAlmostEqual(classic["GO:R"], 1.0)
+
+        # nothing is significant at 0.01, so elim does not change anything
+        self.assertEqual(classic, elim)
+
+
+    def test_classic_matches_hypergeom(self):
+        gorich = self.gorich(0.01)
+        dag = gorich.dag
+        annotated = dict((g, set(a for t in GENE2GO[g] for a in dag.ancestors(dag.alt_ids.get(t, t))))
+                         for g in gorich.universe)
+
+        for genes in [INTERESTING, ["g6", "g7"], ["g1", "g6", "g8", "g9", "g10"], ["g5"]]:
+            classic, elim, sigcounts, sigtotal = self.pvalues(gorich, genes)
+            drawn = [g for g in genes if g in annotated]
+
+            for term in gorich.terms:
+                size = sum(1 for g in annotated if term in annotated[g])
+                k = sum(1 for g in drawn if term in annotated[g])
+                self.assertEqual(sigcounts[term], k)
+                self.assertEqual(classic[term], hypergeom.sf(k - 1, 10, size, len(drawn)))
+
+
+    def test_elim_removes_genes_from_parents(self):
+        # B (7/210) is significant: its genes g1-g3 are removed from A and the root,
+        # which leaves A with g4 and g5 only, i.e. 1 - C(8,4)/C(10,4)
+        classic, elim, sigcounts, sigtotal = self.pvalues(self.gorich(0.05), INTERESTING)
+
+        self.assertAlmostEqual(elim["GO:B"], 7 / 210.0)
+        self.assertAlmostEqual(elim["GO:D"], 28 / 210.0)
+        self.assertAlmostEqual(elim["GO:A"], 1 - 70 / 210.0)
+        self.assertAlmostEqual(elim["GO:C"], 1.0)
+        self.assertAlmostEqual(elim["GO:R"], 1.0)
+
+        # B and D both significant: the genes they share are removed only once
+        classic, elim, sigcounts, sigtotal = self.pvalues(self.gorich(0.15), INTERESTING)
+        self.assertAlmostEqual(elim["GO:D"], 28 / 210.0)
+        self.assertAlmostEqual(elim["GO:A"], 1 - 70 / 210.0)
+
+
+    def test_gen_table(self):
+        gorich = self.gorich(0.05)
+        rows = gorich.gen_table(*gorich.test_sets([INTERESTING])[0])
+
+        # ordered by elim, at most topnodes rows; the rank is the classic one
+        self.assertEqual([row[0] for row in rows], ["GO:B", "GO:D", "GO:A"])
+        self.assertEqual(rows[0], ("GO:B", "term B", 3, 3, "1.20", 2, "0.033", "0.033"))
+        self.assertEqual(rows[2][5:], (1, "0.024", "0.67"))
+
+        self.assertEqual(gorich.test_sets([["x1", "g11"]]), [None])
+
+# ========================================================================================
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os, shutil, tempfile, unittest
+import numpy as np
+import pandas as pd
+
+from makimono import plotter
+from makimono.expression import ExpressionMatrix
+
+# ========================================================================================
+
+class MlplotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+
+    def test_dotted_set_names_are_png(self):
+        subset = ExpressionMatrix(["g1", "g2"], np.array([[1.0, 2.0, 4.0], [3.0, 2.0, 1.0]]))
+        mlp = plotter.Mlplot([0, 1, 2], [0, 1, 2])
+
+        mlp.plot_mpl_figure(subset, "set.v2", savelocation=self.folder)
+        mlp.plot_density_figure(subset, "set.pdf", savelocation=self.folder)
+
+        self.assertEqual(sorted(os.listdir(self.folder)), ["set.pdf.png", "set.v2.png"])
+        for name in os.listdir(self.folder):
+            with open(os.path.join(self.folder, name), "rb") as fh:
+                self.assertEqual(fh.read(8), "\x89PNG\r\n\x1a\n")
+
+
+    def test_axis_labels(self):
+        subset = ExpressionMatrix(["g1", "g2"], np.array([[1.0, 2.0, 4.0], [3.0, 2.0, 1.0]]))
+        mlp = plotter.Mlplot([0, 1, 2], [0, 1, 2])
+
+        fig, ax = mlp.line_axes("linear", "z-scored log normalized expression counts")
+        self.assertEqual(ax.get_ylabel(), "z-scored log normalized expression counts")
+        self.assertEqual(mlp.line_axes("linear")[1].get_ylabel(), "normalized expression counts")
+
+
+
+class BlurTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.subset = ExpressionMatrix(["g1", "g2"], np.array([[1.0, 2.0, 4.0], [3.0, 2.0, 1.0]]))
+        self.blur = plotter.Blur([0, 1, 2], [0, 1, 2])
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def page(self, term):
+        kegg = pd.DataFrame([["03010", 0.001, np.inf, 0.5, 2, 10, term]],
+                            columns=["KEGGID", "Pvalue", "OddsRatio", "ExpCount", "Count", "Size", "Term"])
+        plus = {"bp": None, "mf": None, "cc": None, "kegg": kegg, "alpha": 0.05}
+
+        self.blur.generate_interactive_bokeh_plot(self.subset, "set", self.folder, plus=plus)
+        with open(os.path.join(self.folder, "set.html")) as fh:
+            return fh.read()
+
+
+    def test_axis_label(self):
+        self.blur.generate_interactive_bokeh_plot(self.subset, "set", self.folder,
+                                                  ylabel="log2 normalized expression counts per million")
+
+        with open(os.path.join(self.folder, "set.html")) as fh:
+            self.assertTrue("log2 normalized expression counts per million" in fh.read())
+
+
+    def test_failed_page_leaves_previous_one(self):
+        previous = self.page(u"Caf\xe9ine metabolism")
+        self.assertTrue("Caf\xe9ine metabolism" in previous)
+
+        # (a character latin-1 cannot encode fails the page halfway through)
+        self.assertRaises(UnicodeEncodeError, self.page, u"Snow \u2603 metabolism")
+
+        self.assertEqual(os.listdir(self.folder), ["set.html"])
+        with open(os.path.join(self.folder, "set.html")) as fh:
+            self.assertEqual(fh.read(), previous)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os, unittest
+import numpy as np
+
+from makimono import profiling
+
+# ========================================================================================
+
+@unittest.skipUnless(os.path.exists("/proc/self/statm"), "needs /proc (Linux)")
+class ProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.profiler = profiling.enable()
+
+    def tearDown(self):
+        profiling.disable()
+
+
+    def test_rss_change_per_stage(self):
+        with profiling.task("set"):
+            with profiling.stage("allocating"):
+                kept = np.ones(64 * 1024 * 1024 // 8)
+            with profiling.stage("idle"):
+                pass
+
+        records = dict((r["stage"], r) for r in self.profiler.records)
+
+        # (the stages after an allocation no longer report it, unlike a peak would)
+        self.assertTrue(records["allocating"]["rss_change"] > 48)
+        self.assertTrue(abs(records["idle"]["rss_change"]) < 16)
+        self.assertTrue(records["set"]["rss_change"] > 48)
+        self.assertEqual(records["idle"]["task"], "set")
+
+        summary = self.profiler.summary()
+        self.assertTrue("RSS change (MB)" in summary and "peak RSS (MB)" not in summary)
+        del kept
+
+
+if __name__ == "__main__":
+    unittest.main()
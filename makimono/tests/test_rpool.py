@@ -0,0 +1,71 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os, sys, types, shutil, tempfile, unittest
+
+from makimono import rpool
+from makimono.cache import ResultCache
+from makimono.rpool import EnrichmentExecutor
+
+# ========================================================================================
+
+class EnrichmentExecutorTest(unittest.TestCase):
+
+    def test_refuses_to_fork_a_running_r(self):
+        # (importing rpy2.robjects starts R; a placeholder module stands for it if needed)
+        started = sys.modules.get("rpy2.robjects") is not None
+        if not started:
+            sys.modules["rpy2.robjects"] = types.ModuleType("rpy2.robjects")
+
+        try:
+            executor = EnrichmentExecutor(2)
+            executor.add_kegg("keggmap.tsv", 0.05, "cre")
+            self.assertRaises(RuntimeError, next, executor.run(["set.txt"]))
+        finally:
+            if not started:
+                del sys.modules["rpy2.robjects"]
+
+
+
+class CopyEngine(object):
+
+    # an enrichment whose "result" is a copy of the set file (see run_task)
+    def __init__(self, cache):
+        self.cache = cache
+
+    def enrich_many(self, targetpaths):
+        for targetspath in targetpaths:
+            genes = open(targetspath).read().split()
+            outname = targetspath + "_enrichment.tsv"
+            key = self.cache.key(genes, targetspath, "copy", 0.05)
+            if not self.cache.fetch(key, outname):
+                shutil.copy(targetspath, outname)
+                self.cache.store(key, outname)
+
+
+
+class RunTaskTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.setfile = os.path.join(self.folder, "set.txt")
+        with open(self.setfile, "w") as fh:
+            fh.write("g1\ng2\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        del rpool.ENGINES[:]
+
+
+    def test_cache_stats_of_the_task(self):
+        rpool.ENGINES.append(("copy", CopyEngine(ResultCache(os.path.join(self.folder, "cache")))))
+
+        self.assertEqual(rpool.run_task((0, self.setfile)),
+                         ("copy", self.setfile, None, {"hits": 0, "misses": 1}))
+        self.assertEqual(rpool.run_task((0, self.setfile)),
+                         ("copy", self.setfile, None, {"hits": 1, "misses": 0}))
+
+# ========================================================================================
+
+if __name__ == "__main__":
+    unittest.main()
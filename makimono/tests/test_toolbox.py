@@ -0,0 +1,76 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os, shutil, tempfile, unittest
+
+from makimono import toolbox
+
+# ========================================================================================
+
+BP = "GO.ID\tTerm\tAnnotated\tSignificant\tExpected\tRank in classicFisher\tclassicFisher\telimFisher\n" \
+     "GO:0006412\ttranslation\t10\t8\t2.25\t1\t1.2e-06\t1.2e-06\n"
+
+KEGG = "KEGGID\tPvalue\tOddsRatio\tExpCount\tCount\tSize\tTerm\n" \
+       "03010\t0.001\tInf\t2.25\t8\t10\tRibosome\n"
+
+class EnrichmentValuesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, folder, name, content):
+        path = os.path.join(self.folder, folder)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        with open(os.path.join(path, name), "w") as fh:
+            fh.write(content)
+
+
+    def test_single_set_without_index(self):
+        self.write("goenrich/BP", "set_enrichment.tsv", BP)
+        self.write("keggenrich", "set_enrichment.tsv", KEGG)
+
+        plus = toolbox.process_enrichment_values(self.folder, "set", 0.05)
+
+        self.assertEqual(plus.paths, {"bp": os.path.join(self.folder, "goenrich/BP", "set_enrichment.tsv"),
+                                      "kegg": os.path.join(self.folder, "keggenrich", "set_enrichment.tsv")})
+        self.assertEqual(list(plus["bp"]["GO.ID"]), ["GO:0006412"])
+        self.assertEqual(list(plus["kegg"]["KEGGID"]), ["03010"])
+        self.assertIsNone(plus["mf"])
+
+
+    def test_mapping_methods_read_the_results(self):
+        self.write("goenrich/BP", "set_enrichment.tsv", BP)
+        index = toolbox.EnrichmentIndex(self.folder)
+        plus = toolbox.process_enrichment_values(self.folder, "set", 0.05, index=index)
+
+        self.assertEqual(sorted(plus), ["alpha", "bp", "cc", "kegg", "mf"])
+        self.assertEqual(len(plus), 5)
+        self.assertTrue("bp" in plus)
+        self.assertFalse("go" in plus)
+        self.assertRaises(KeyError, lambda: plus["go"])
+
+        items = dict(plus.items())
+        self.assertEqual(items["alpha"], 0.05)
+        self.assertEqual(list(items["bp"]["Term"]), ["translation"])
+        self.assertEqual(items["kegg"], None)
+
+        copy = plus.copy()
+        self.assertTrue(isinstance(copy, dict))
+        self.assertTrue(copy["bp"] is plus["bp"])
+        self.assertEqual(sum(1 for value in plus.values() if value is not None), 2)
+
+
+    def test_unreadable_results_are_none(self):
+        self.write("goenrich/CC", "set_enrichment.tsv", "")
+        plus = toolbox.process_enrichment_values(self.folder, "set", 0.05)
+
+        self.assertTrue("cc" in plus.paths)
+        self.assertIsNone(plus["cc"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import unittest
+import numpy as np
+
+from makimono import transform
+
+# ========================================================================================
+
+class ChainTest(unittest.TestCase):
+
+    def test_axis_labels(self):
+        self.assertEqual(transform.axis_label([]), "normalized expression counts")
+        self.assertEqual(transform.axis_label(transform.parse_chain("ln")), "log normalized expression counts")
+        self.assertEqual(transform.axis_label(transform.parse_chain("cpm,log2")),
+                         "log2 normalized expression counts per million")
+        self.assertEqual(transform.axis_label(transform.parse_chain("log10,fc")),
+                         "log10 normalized expression counts, relative to the first time point")
+        self.assertEqual(transform.axis_label(transform.parse_chain("ln,zscore")),
+                         "z-scored log normalized expression counts")
+
+
+    def test_every_step_has_a_label(self):
+        steps = set(name for name, description in transform.STEPS) | set(transform.LOGS)
+        self.assertEqual(set(transform.LABELS), steps)
+
+
+    def test_takes_log(self):
+        self.assertTrue(transform.takes_log(["cpm", "log2"]))
+        self.assertFalse(transform.takes_log(["cpm", "zscore", "fc"]))
+        self.assertFalse(transform.takes_log([]))
+
+
+    def test_log_of_zero(self):
+        values = transform.apply_chain(np.array([[0.0, 1.0]]), ["ln"])
+        np.testing.assert_array_equal(values, [[-np.inf, 0.0]])
+
+
+if __name__ == "__main__":
+    unittest.main()
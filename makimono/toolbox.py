@@ -1,10 +1,10 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-import os, sys, re, codecs, json
-import pandas as pd
+import os, sys, re, codecs, json, collections
 
-pd.set_option('display.max_colwidth', -1)
+import profiling
+from expression import parse_expression_lines
 
 """
 Collection of 'orphan' functions, that are either required
@@ -25,7 +25,7 @@ def read_annotation_file(directory, f):
 
     patt = re.compile('^(\S+)\t(.*)', re.IGNORECASE)
 
-    with codecs.open(os.path.join(directory,f), encoding='latin-1') as fh:
+    with profiling.stage("annotations"), codecs.open(os.path.join(directory,f), encoding='latin-1') as fh:
         for line in fh:
 
             m = patt.search(line)
@@ -36,6 +36,26 @@ def read_annotation_file(directory, f):
 
 # ========================================================================================
 
+def collect_set_identifiers(directory, fileslist):
+
+    """
+    Pre-scans a list of set files and returns the union of the identifiers
+    (first column) they list.
+    """
+
+    identifiers = set()
+
+    for f in fileslist:
+        with open(os.path.join(directory, f)) as fh:
+            for line in fh:
+                ident = line.split("\t", 1)[0].strip()
+                if ident:
+                    identifiers.add(ident)
+
+    return identifiers
+
+# ========================================================================================
+
 def process_title(text):
 
     """
@@ -63,30 +83,71 @@ def get_spaced_colors(n):
 
 # ========================================================================================
 
-def process_expression_values(expressionfile, reps):
+def process_expression_values(expressionfile, reps, cache=None, keep=None, pseudocount=1):
 
     """
-    Processes a tsv file containing expression counts into a dictionary.
+    Processes a tsv file containing expression counts into an ExpressionMatrix
+    (dictionary-like: identifier -> array of values per time point).
     NOTES: Expects lines to be in the shape: ID A1 ... An ... Z1 ... Zn
            where A-Z are the different of time points (series) and each
            having n replicates. The replicates are then conflated by 
            calculing the average for each observation at time point.
-    WARNING: The function also adds +1 to each expression count in order
-             to deal with possible ZEROS so it does not tilt-out in a
-             logarithmic axis.
+    WARNING: The function also adds +1 (the 'pseudocount') to each expression
+             count in order to deal with possible ZEROS so it does not tilt-out
+             in a logarithmic axis.
+    If an ExpressionCache is supplied, previously parsed values are memory-mapped
+    from it instead of re-parsing the file (and stored there on a cache miss).
+    If 'keep' (a set of identifiers) is supplied, only those rows are returned:
+    without a cache only they are parsed; the cache always holds the whole file
+    (so that later runs over other sets can reuse it), and only the kept rows
+    are read out of its memory-mapped values.
     """
-    data = {}
-    with expressionfile as fh:
-        for line in fh:
-            token = line.split("\t")
-            token = [token[0]] + [int(x.strip())+1 for x in token[1:]]            
-            confl = []
-            for i in range(1, len(token)-1, reps):
-                confl.append( (token[i] + token[i+1])/float(reps) )            
-            data[token[0]] = confl    
+
+    with profiling.stage("expression"), expressionfile as fh:
+
+        if cache is not None and cache.cacheable(fh.name):
+            data = cache.load(fh.name, reps, pseudocount, keep=keep)
+            if data is not None:
+                return data
+        else:
+            cache = None
+
+        data = parse_expression_lines(fh, reps, pseudocount=pseudocount,
+                                      keep=keep if cache is None else None)
+
+    if cache is not None:
+        cache.store(expressionfile.name, reps, data, pseudocount)
+        data = kept_rows(data, keep)
 
     return data
 
+
+
+def kept_rows(data, keep):
+
+    # the rows of 'data' listed in 'keep' (None: all of them), in file order
+    if keep is None:
+        return data
+
+    return data.subset([k for k in data.ids if k in keep])
+
+# ========================================================================================
+
+def import_pandas():
+
+    """
+    Returns the pandas module, with the display options the html reports rely
+    on. pandas is only imported by the code paths that read or render
+    enrichment results, so the plot-only ones start faster.
+    """
+
+    import pandas as pd
+
+    pd.set_option('display.max_colwidth', -1)
+    pd.options.mode.chained_assignment = None  # default='warn'
+
+    return pd
+
 # ========================================================================================
 
 def read_tsv(tsvpath, ont):
@@ -97,6 +158,8 @@ def read_tsv(tsvpath, ont):
 
     """
 
+    pd = import_pandas()
+
     try:
         if ont != "KEGG Pathways":
             df = pd.read_csv(tsvpath, sep="\t")
@@ -111,46 +174,145 @@ def read_tsv(tsvpath, ont):
 
 # ========================================================================================
 
+# Enrichment results folders (relative to the sets folder): result key, folder, label
+ENRICHMENT_FOLDERS = [('bp', 'goenrich/BP', "GO Biological Process"),
+                      ('mf', 'goenrich/MF', "GO Molecular Function"),
+                      ('cc', 'goenrich/CC', "GO Cellular Component"),
+                      ('kegg', 'keggenrich', "KEGG Pathways")]
+
+class EnrichmentIndex(object):
+
+    """
+    Index of the enrichment result files available under a sets folder, built
+    with a single scan of its goenrich/BP|MF|CC and keggenrich sub-folders:
+    basename -> {'bp'|'mf'|'cc'|'kegg': path to <basename>_enrichment.tsv}.
+    """
+
+    def __init__(self, directory):
+
+        self.directory = directory
+        self.files = {}
+
+        for key, folder, ont in ENRICHMENT_FOLDERS:
+            path = os.path.join(directory, folder)
+            try:
+                names = os.listdir(path)
+            except OSError:
+                continue
+
+            for f in names:
+                if f.endswith('_enrichment.tsv'):
+                    self.files.setdefault(f[:-len('_enrichment.tsv')], {})[key] = os.path.join(path, f)
+
+
+    def lookup(self, basename):
+        return self.files.get(basename, {})
+
+# ========================================================================================
+
+class LazyEnrichment(collections.Mapping):
+
+    """
+    Read-only mapping of enrichment results (as returned by
+    process_enrichment_values: 'bp', 'mf', 'cc', 'kegg' and 'alpha') whose
+    dataframes are only read from disk when first accessed, i.e. when the
+    templater actually renders that section. Missing or unreadable result
+    files are reported and left as None.
+    """
+
+    def __init__(self, basename, paths, alpha):
+
+        self.basename = basename
+        self.paths = paths
+        self.loaded = {'alpha': alpha}
+
+
+    def __getitem__(self, key):
+
+        if key not in self.loaded:
+            self.loaded[key] = self.read(key)
+
+        return self.loaded[key]
+
+
+    def __iter__(self):
+
+        yield 'alpha'
+        for key, folder, ont in ENRICHMENT_FOLDERS:
+            yield key
+
+
+    def __len__(self):
+        return len(ENRICHMENT_FOLDERS) + 1
+
+
+    def read(self, key):
+
+        for k, folder, ont in ENRICHMENT_FOLDERS:
+            if k == key:
+                break
+        else:
+            raise KeyError(key)
+
+        tsvpath = self.paths.get(key)
+
+        if tsvpath is None:
+            print "No %s enrichment found for %s!" % (ont, self.basename+'_enrichment')
+            return None
+
+        try:
+            with profiling.stage("enrichment"):
+                return read_tsv(tsvpath, ont)
+        except (IOError, OSError, ValueError) as e:
+            print "Could not read %s (%s)" % (tsvpath, e)
+            return None
+
+
+    def copy(self):
+        return dict(self)
+
+# ========================================================================================
+
 # WARNING: Currently relies on a strict folder structure and file name pattern
 #          if no enrichment results are being shown probably that structure is
 #          not being met (assuming enrichment data is actually available).
-def process_enrichment_values(directory, basename, alpha):
+def process_enrichment_values(directory, basename, alpha, index=None, store=None):
 
     """
     Processes KEGG/GO enrichment results files (produced by GOstats and topGO)
-    into a dictionary.
+    into a dictionary. The available files are looked up in an EnrichmentIndex
+    (pass one in to avoid re-scanning the folder for every set; without one,
+    the four possible result paths of the set are checked) and each of them is
+    only read when its entry is accessed. If an (enrichstore) EnrichmentStore
+    is supplied, the results are read from it instead of the tsv files.
     """
-    
 
-    try:
-        bp = read_tsv(os.path.join(directory, 'goenrich/BP', 
-                              basename+'_enrichment.tsv'), "GO Biological Process")
-    except:
-        bp = None
-        
-        
-    try:
-        mf = read_tsv(os.path.join(directory, 'goenrich/MF', 
-                              basename+'_enrichment.tsv'), "GO Molecular Function")
-    except:
-        mf = None
-        
-    try:
-        cc = read_tsv(os.path.join(directory, 'goenrich/CC',
-                              basename+'_enrichment.tsv'), "GO Cellular Component")
-    except:
-        cc = None
-        
-        
-    try:
-        kegg = read_tsv(os.path.join(directory, 'keggenrich', 
-                                basename+'_enrichment.tsv'), "KEGG Pathways")
-    except:
-        kegg = None
+    if store is not None:
+        with profiling.stage("enrichment"):
+            return store.frames(directory, basename, alpha)
+
+    if index is None:
+        paths = enrichment_paths(directory, basename)
+    else:
+        paths = index.lookup(basename)
+
+    return LazyEnrichment(basename, paths, alpha)
 
 
-    extra = {'bp':bp, 'mf':mf, 'cc': cc, 'kegg':kegg, 'alpha': alpha}
 
-    return extra
+def enrichment_paths(directory, basename):
+
+    """
+    Returns the {'bp'|'mf'|'cc'|'kegg': path} result files of a single set
+    (the EnrichmentIndex lookup, without scanning the folders).
+    """
+
+    paths = {}
+    for key, folder, ont in ENRICHMENT_FOLDERS:
+        path = os.path.join(directory, folder, basename+'_enrichment.tsv')
+        if os.path.isfile(path):
+            paths[key] = path
+
+    return paths
 
 # ========================================================================================
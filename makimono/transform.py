@@ -0,0 +1,143 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+import profiling
+from expression import ExpressionMatrix
+
+"""
+Vectorized transforms of expression values (normalization, log, scaling),
+applied to a whole ExpressionMatrix at once as a chain of steps.
+"""
+
+# ========================================================================================
+
+# step name -> description (for the command line help)
+STEPS = [("cpm", "counts per million (of every time point's total)"),
+         ("ln", "natural log (also 'log')"),
+         ("log2", "base 2 log"),
+         ("log10", "base 10 log"),
+         ("zscore", "center every profile on its mean and scale it by its standard deviation"),
+         ("fc", "fold change versus the first time point (a difference, after a log step)")]
+
+LOGS = {"ln": np.log, "log": np.log, "log2": np.log2, "log10": np.log10}
+
+# step -> how it changes the y-axis label of the plots (see axis_label)
+LABELS = {"cpm": "%s per million", "ln": "log %s", "log": "log %s", "log2": "log2 %s",
+          "log10": "log10 %s", "zscore": "z-scored %s", "fc": "%s, relative to the first time point"}
+
+
+def parse_chain(spec):
+
+    """
+    Parses a comma-separated chain of steps (e.g. "cpm,log2,zscore"); "none" or
+    an empty string is the empty chain. Raises ValueError for unknown steps.
+    """
+
+    if spec is None or spec.strip().lower() in ["", "none"]:
+        return []
+
+    chain = [step.strip().lower() for step in spec.split(",")]
+    known = set(name for name, description in STEPS) | set(LOGS)
+
+    for step in chain:
+        if step not in known:
+            raise ValueError("Unknown transform step '%s' (expected %s)!"
+                             % (step, ", ".join(name for name, description in STEPS)))
+
+    return chain
+
+
+
+def needs_all_rows(chain):
+
+    # counts per million are relative to the totals of the whole expression file
+    return "cpm" in chain
+
+
+
+def takes_log(chain):
+
+    # the log of a zero value (i.e. with a zero pseudocount) is -inf
+    return any(step in LOGS for step in chain)
+
+
+
+def axis_label(chain):
+
+    """
+    Returns the y-axis label of values transformed through 'chain' (e.g.
+    "log2 normalized expression counts per million" for "cpm,log2").
+    """
+
+    label = "normalized expression counts"
+    for step in chain:
+        label = LABELS[step] % label
+
+    return label
+
+
+
+def apply_chain(matrix, chain):
+
+    """
+    Applies a chain of steps to a (genes x time points) value array and returns
+    the result (a new array; 'matrix' itself is left untouched).
+    """
+
+    values = np.array(matrix, dtype=np.float64)
+    logged = False
+
+    # (the log of 0 and a fold change over 0 are left as -inf/nan, quietly)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for step in chain:
+            values, logged = apply_step(values, step, logged)
+
+    return values
+
+
+
+def apply_step(values, step, logged):
+
+    # one step of apply_chain (in place where possible); 'logged' tells whether a
+    # log step came earlier in the chain
+    if step == "cpm":
+        totals = values.sum(axis=0)
+        totals[totals == 0] = 1.0
+        values *= 1e6 / totals
+
+    elif step in LOGS:
+        values = LOGS[step](values)
+        logged = True
+
+    elif step == "zscore":
+        values -= values.mean(axis=1)[:, None]
+        sd = values.std(axis=1)
+        sd[sd == 0] = 1.0
+        values /= sd[:, None]
+
+    elif step == "fc" and values.shape[1] > 0:
+        if logged:
+            values -= values[:, :1]
+        else:
+            first = values[:, :1].copy()
+            first[first == 0] = np.nan
+            values /= first
+
+    return values, logged
+
+
+
+def transform_expression(data, chain):
+
+    """
+    Returns an ExpressionMatrix holding the transformed values of 'data' (or
+    'data' itself for the empty chain).
+    """
+
+    if not chain:
+        return data
+
+    with profiling.stage("transform"):
+        return ExpressionMatrix(data.ids, apply_chain(data.matrix, chain))
@@ -25,6 +25,7 @@ setup(name='makimono',
           'bokeh',
           'jinja2',
           'numpy',
+          'scipy',
           'pandas',
           'matplotlib',
           'rpy2',  